@@ -1,125 +1,613 @@
-from fastapi import FastAPI, HTTPException, Request, Form
-from fastapi.responses import HTMLResponse, FileResponse
-from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-from typing import List, Dict, Optional
-from recommendation_system import CargoRecommendationSystem
-import uvicorn
-import os
-
-app = FastAPI(
-    title="Cargo Recommendation System API",
-    description="API для системы рекомендаций по грузоперевозкам",
-    version="1.0.0"
-)
-
-templates = Jinja2Templates(directory="templates")
-recommendation_system = CargoRecommendationSystem()
-
-class CargoData(BaseModel):
-    weight: float
-    distance: float
-    delivery_time: float
-    cost: float
-
-@app.get("/", response_class=HTMLResponse)
-async def root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request, "result": None})
-
-@app.post("/web/recommend", response_class=HTMLResponse)
-async def web_recommend(request: Request,
-                       weight: float = Form(...),
-                       distance: float = Form(...),
-                       delivery_time: float = Form(...),
-                       cost: float = Form(...)):
-    if recommendation_system.model is None:
-        if os.path.exists("cargo_data.csv"):
-            recommendation_system.load_data("cargo_data.csv")
-            recommendation_system.train_model()
-            recommendation_system.save_model()
-    cargo = {
-        "weight": weight,
-        "distance": distance,
-        "delivery_time": delivery_time,
-        "cost": cost
-    }
-    routes = recommendation_system.get_route_recommendations(cargo)
-    vehicles = recommendation_system.get_vehicle_recommendations(cargo)
-    cost_optimization = recommendation_system.get_cost_optimization(cargo)
-    result = {
-        "routes": routes,
-        "vehicles": vehicles,
-        "cost_optimization": cost_optimization
-    }
-    return templates.TemplateResponse("index.html", {"request": request, "result": result})
-
-@app.get("/web/report", response_class=HTMLResponse)
-async def web_report():
-    if os.path.exists("cargo_analysis_report.html"):
-        return FileResponse("cargo_analysis_report.html")
-    return HTMLResponse("<h2>Отчёт ещё не сгенерирован. Сначала обучите модель.</h2>")
-
-@app.post("/train")
-async def train_model():
-    try:
-        if not os.path.exists("cargo_data.csv"):
-            raise HTTPException(status_code=404, detail="Training data file not found")
-        recommendation_system.load_data("cargo_data.csv")
-        recommendation_system.train_model()
-        recommendation_system.save_model()
-        return {
-            "message": "Model trained successfully",
-            "report_url": "cargo_analysis_report.html"
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.post("/recommend/route")
-async def get_route_recommendations(cargo_data: CargoData):
-    try:
-        if recommendation_system.model is None:
-            raise HTTPException(status_code=400, detail="Model not trained. Please train the model first.")
-        recommendations = recommendation_system.get_route_recommendations(cargo_data.dict())
-        return {"recommendations": recommendations}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.post("/recommend/vehicle")
-async def get_vehicle_recommendations(cargo_data: CargoData):
-    try:
-        recommendations = recommendation_system.get_vehicle_recommendations(cargo_data.dict())
-        return {"recommendations": recommendations}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.post("/optimize/cost")
-async def get_cost_optimization(cargo_data: CargoData):
-    try:
-        recommendations = recommendation_system.get_cost_optimization(cargo_data.dict())
-        return recommendations
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.post("/recommend/weather")
-async def get_weather_recommendations(cargo_data: CargoData):
-    try:
-        recommendations = recommendation_system.get_weather_recommendations(cargo_data.dict())
-        return recommendations
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.get("/model/info")
-async def get_model_info():
-    try:
-        if recommendation_system.model is None:
-            return {"status": "Model not trained"}
-        return {
-            "status": "Model trained",
-            "n_clusters": recommendation_system.model.n_clusters,
-            "n_samples": len(recommendation_system.data) if recommendation_system.data is not None else 0
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-if __name__ == "__main__":
+from fastapi import FastAPI, HTTPException, Request, Form, Query, Header, Depends
+from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse
+from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import List, Dict, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+from recommendation_system import CargoRecommendationSystem, RECOMMENDATION_SECTIONS
+from route_index import FEATURES
+from rules import cargo_matrix
+from training_jobs import TrainingJobManager
+from model_registry import ModelRegistry
+from load_planner import DEFAULT_BAND_WIDTH, DEFAULT_STOP_HOURS, DEFAULT_MAX_DELAY, DEFAULT_TIME_BUDGET
+import load_planner
+from response_cache import ResponseCache
+from bulk_recommend import (
+    FORMATS, DEFAULT_CHUNK_SIZE, BodyStreamingResponse, MultipartUpload, detect_format, stream_recommendations
+)
+import model_artifact
+import request_log
+import road_network
+import metrics
+import json
+import time
+import uvicorn
+import os
+
+recommendation_system = CargoRecommendationSystem()
+
+def install_system(system: CargoRecommendationSystem):
+    """Атомарная замена рабочей системы рекомендаций"""
+    global recommendation_system
+    recommendation_system = system
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = "cargo_model"
+# Исторические данные для обучения (файл репозитория не изменяется)
+DATA_PATH = "cargo_data.csv"
+# Маршруты, принятые через /ingest; обучение читает их вместе с DATA_PATH
+INGESTED_DATA_PATH = os.environ.get("CARGO_INGESTED_DATA", os.path.join(MODEL_PATH, "ingested_routes.csv"))
+# Наибольшее число похожих маршрутов в одном ответе
+MAX_SIMILAR_ROUTES = 1000
+# Как часто каждый рабочий процесс проверяет, не опубликована ли новая версия модели (0 - не проверять)
+MODEL_POLL_INTERVAL = float(os.environ.get("CARGO_MODEL_POLL_INTERVAL", 5))
+# Загружать опубликованные модели без scikit-learn (только выдача рекомендаций, без /ingest)
+INFERENCE_ONLY = os.environ.get("CARGO_INFERENCE_ONLY", "").lower() in ("1", "true", "yes")
+# Каталог снимков метрик рабочих процессов (serve.py задает его при нескольких процессах)
+METRICS_DIR = os.environ.get("CARGO_METRICS_DIR") or None
+# Как часто процесс записывает снимок своих метрик для /metrics других процессов
+METRICS_INTERVAL = float(os.environ.get("CARGO_METRICS_INTERVAL", 5))
+
+# Пути, запросы к которым записываются в журнал (тело /recommend/bulk не журналируется)
+LOGGED_PATHS = ("/recommend", "/optimize")
+# Журнал запросов для воспроизведения нагрузки (replay.py); включается переменной CARGO_REQUEST_LOG
+request_logger = request_log.from_env()
+
+# Другие версии моделей для запросов с X-Model-Version или ?model_version=
+model_registry = ModelRegistry(
+    MODEL_PATH,
+    memory_budget=int(float(os.environ.get("CARGO_MODEL_MEMORY_MB", 512)) * 2 ** 20),
+    inference_only=INFERENCE_ONLY
+)
+# Дорожная сеть для запросов с origin/destination вместо distance (файл ребер CARGO_ROAD_NETWORK)
+network: Optional[road_network.RoadNetwork] = None
+report_lock = asyncio.Lock()
+response_cache = ResponseCache(
+    max_size=int(os.environ.get("CARGO_CACHE_SIZE", 10_000)),
+    ttl=float(os.environ.get("CARGO_CACHE_TTL", 300)),
+    precision=int(os.environ.get("CARGO_CACHE_PRECISION", 0))
+)
+
+def training_data() -> List[str]:
+    """CSV для обучения: исторические данные и маршруты, принятые через /ingest"""
+    return [DATA_PATH] + ([INGESTED_DATA_PATH] if os.path.exists(INGESTED_DATA_PATH) else [])
+
+def load_saved_system() -> Optional[CargoRecommendationSystem]:
+    """Загрузка сохраненной модели вместе с таблицей маршрутов"""
+    if model_artifact.latest_version(MODEL_PATH) is not None:
+        system = CargoRecommendationSystem()
+        system.load_model(MODEL_PATH, inference_only=INFERENCE_ONLY)
+        return system
+    # Модель в старом формате не содержит маршрутов, они берутся из CSV
+    if os.path.exists("cargo_model.joblib") and os.path.exists(DATA_PATH):
+        system = CargoRecommendationSystem()
+        system.load_data(training_data())
+        system.load_model(MODEL_PATH)
+        return system
+    return None
+
+def load_published_system(version: str) -> CargoRecommendationSystem:
+    """Загрузка опубликованной версии и прогрев до подмены рабочей системы"""
+    system = CargoRecommendationSystem()
+    system.load_model(MODEL_PATH, version=version, inference_only=INFERENCE_ONLY)
+    # Первый запрос подтягивает отображенные в память страницы индекса;
+    # пусть это произойдет здесь, а не на запросе клиента
+    system.get_route_recommendations(dict(zip(FEATURES, system.scaler.mean_.tolist())))
+    return system
+
+def install_published_version(version: str):
+    """Установка версии, опубликованной задачей обучения этого процесса"""
+    if recommendation_system.model_version != version:
+        install_system(load_published_system(version))
+
+training_jobs = TrainingJobManager(on_complete=install_published_version, jobs_dir=os.path.join(MODEL_PATH, "jobs"))
+# Задача обучения, запущенная веб-формой, пока модель не загружена
+web_training_job: Optional[str] = None
+
+def start_web_training() -> str:
+    """Обучение для веб-формы; повторные запросы ждут уже запущенную задачу"""
+    global web_training_job
+    status = training_jobs.get_status(web_training_job) if web_training_job else None
+    if status is None or status["status"] in ("completed", "failed"):
+        web_training_job = training_jobs.submit(training_data(), MODEL_PATH)
+    return web_training_job
+
+def refresh_shared_state():
+    """Применение маршрутов и правил, измененных другими рабочими процессами"""
+    for system in [recommendation_system] + model_registry.loaded():
+        system.replay_ingest_log(MODEL_PATH)
+        system.refresh_rules()
+
+async def watch_model_versions():
+    """Фоновая подмена модели, когда другой процесс публикует новую версию.
+
+    Для текущей версии применяются пакеты /ingest, принятые другими
+    процессами, и перечитывается измененный файл правил.
+    """
+    while True:
+        await asyncio.sleep(MODEL_POLL_INTERVAL)
+        try:
+            version = model_artifact.latest_version(MODEL_PATH)
+            if version is None or version == recommendation_system.model_version:
+                await run_in_threadpool(refresh_shared_state)
+                continue
+            system = await run_in_threadpool(load_published_system, version)
+            # Пока шла загрузка, эту же версию могла установить задача обучения этого процесса
+            if recommendation_system.model_version != version:
+                install_system(system)
+                logger.info("Установлена модель версии %s", version)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Версию могли удалить при очистке старых артефактов; повторим на следующей проверке
+            logger.exception("Не удалось загрузить новую версию модели")
+
+def dump_metrics():
+    metrics.update_model_gauges(recommendation_system)
+    metrics.REGISTRY.dump(METRICS_DIR)
+
+async def publish_metrics():
+    """Периодическая запись снимка метрик процесса, чтобы /metrics любого процесса показывал все"""
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        try:
+            await run_in_threadpool(dump_metrics)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Не удалось записать снимок метрик")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Модель загружается при старте, чтобы первый запрос не ждал загрузки или обучения
+    global network
+    system = load_saved_system()
+    if system is not None:
+        install_system(system)
+    network = await run_in_threadpool(road_network.from_env)
+    watcher = asyncio.create_task(watch_model_versions()) if MODEL_POLL_INTERVAL > 0 else None
+    publisher = asyncio.create_task(publish_metrics()) if METRICS_DIR is not None else None
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    if publisher is not None:
+        publisher.cancel()
+        metrics.REGISTRY.discard(METRICS_DIR)
+    training_jobs.shutdown()
+    load_planner.shutdown_pool()
+    if request_logger is not None:
+        request_logger.close()
+
+app = FastAPI(
+    title="Cargo Recommendation System API",
+    description="API для системы рекомендаций по грузоперевозкам",
+    version="1.0.0",
+    lifespan=lifespan
+)
+
+templates = Jinja2Templates(directory="templates")
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Шаблон пути вместо фактического URL, чтобы не плодить ряды метрик
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, path=path)
+        metrics.HTTP_REQUESTS.inc(method=request.method, path=path, status=status)
+        if status >= 500:
+            metrics.HTTP_ERRORS.inc(method=request.method, path=path)
+
+async def log_requests(request: Request, call_next):
+    path = request.url.path
+    if not path.startswith(LOGGED_PATHS) or path == "/recommend/bulk":
+        return await call_next(request)
+    body = await request.body()
+    start = time.perf_counter()
+    response = await call_next(request)
+    try:
+        payload = json.loads(body) if body else None
+    except ValueError:
+        payload = body.decode("utf-8", errors="replace")
+    request_logger.log({
+        "ts": time.time(),
+        "method": request.method,
+        "path": path,
+        "query": request.url.query,
+        "body": payload,
+        "status": response.status_code,
+        "latency_ms": (time.perf_counter() - start) * 1000
+    })
+    return response
+
+if request_logger is not None:
+    app.middleware("http")(log_requests)
+
+class CargoData(BaseModel):
+    weight: float
+    distance: Optional[float] = None
+    delivery_time: Optional[float] = None
+    cost: float
+    # Узлы дорожной сети; по ним рассчитываются не переданные distance и delivery_time
+    origin: Optional[int] = None
+    destination: Optional[int] = None
+
+class RouteData(CargoData):
+    distance: float
+    delivery_time: float
+    route_id: int
+    success_rate: float
+
+class ShipmentData(CargoData):
+    shipment_id: Optional[str] = None
+
+def cargo_features(cargo_data: CargoData) -> Dict:
+    """Признаки груза; недостающие distance и delivery_time рассчитываются по дорожной сети"""
+    cargo = cargo_data.dict(include=set(FEATURES))
+    if cargo["distance"] is not None and cargo["delivery_time"] is not None:
+        return cargo
+    if cargo_data.origin is None or cargo_data.destination is None:
+        raise HTTPException(status_code=422, detail="Either distance and delivery_time or origin and destination are required")
+    if network is None:
+        raise HTTPException(status_code=400, detail="Road network is not configured")
+    try:
+        route = network.route(cargo_data.origin, cargo_data.destination)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    for key, value in route.items():
+        if cargo[key] is None:
+            cargo[key] = value
+    return cargo
+
+@app.get("/", response_class=HTMLResponse)
+async def root(request: Request):
+    return templates.TemplateResponse("index.html", {"request": request, "result": None})
+
+@app.post("/web/recommend", response_class=HTMLResponse)
+async def web_recommend(request: Request,
+                       weight: float = Form(...),
+                       distance: float = Form(...),
+                       delivery_time: float = Form(...),
+                       cost: float = Form(...)):
+    system = recommendation_system
+    if system.model is None:
+        # Обучение не выполняется в цикле событий: модель обучается в пуле задач,
+        # а форма отвечает, что нужно подождать
+        if not os.path.exists(DATA_PATH):
+            return HTMLResponse("<h2>Модель не обучена, а данных для обучения нет.</h2>", status_code=503)
+        job_id = start_web_training()
+        return HTMLResponse(
+            f"<h2>Модель обучается, повторите запрос позже.</h2>"
+            f"<p>Задача <a href=\"/train/{job_id}\">{job_id}</a></p>",
+            status_code=202
+        )
+    cargo = {
+        "weight": weight,
+        "distance": distance,
+        "delivery_time": delivery_time,
+        "cost": cost
+    }
+    result = system.recommend_all(cargo, sections=["routes", "vehicles", "cost_optimization"])
+    return templates.TemplateResponse("index.html", {"request": request, "result": result})
+
+@app.get("/web/report", response_class=HTMLResponse)
+async def web_report():
+    # Отчет строится по требованию и переиспользуется, пока не изменились данные или кластеры
+    system = recommendation_system
+    if system.route_index is not None:
+        async with report_lock:
+            await run_in_threadpool(system.generate_report)
+    if os.path.exists("cargo_analysis_report.html"):
+        return FileResponse("cargo_analysis_report.html")
+    return HTMLResponse("<h2>Отчёт ещё не сгенерирован. Сначала обучите модель.</h2>")
+
+@app.post("/train")
+async def train_model(streaming: bool = False, n_clusters: int = 5, auto_k: bool = False, alias: Optional[str] = None):
+    if alias == model_artifact.LATEST_ALIAS:
+        raise HTTPException(status_code=400, detail=f"Alias '{alias}' is reserved")
+    try:
+        if not os.path.exists(DATA_PATH):
+            raise HTTPException(status_code=404, detail="Training data file not found")
+        job_id = training_jobs.submit(
+            training_data(), MODEL_PATH, n_clusters="auto" if auto_k else n_clusters, streaming=streaming, alias=alias
+        )
+        return {
+            "message": "Training job started",
+            "job_id": job_id,
+            "status_url": f"/train/{job_id}",
+            "report_url": "cargo_analysis_report.html"
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/train/{job_id}")
+async def get_training_status(job_id: str):
+    status = training_jobs.get_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    return status
+
+@app.get("/train/{job_id}/progress")
+async def get_training_progress(job_id: str):
+    progress = training_jobs.get_progress(job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    return {"job_id": job_id, **progress}
+
+@app.post("/ingest")
+async def ingest_routes(routes: List[RouteData]):
+    system = recommendation_system
+    if system.model is None:
+        raise HTTPException(status_code=400, detail="Model not trained. Please train the model first.")
+    try:
+        # Пакет записывается в журнал версии, и остальные рабочие процессы применяют его сами
+        return await run_in_threadpool(
+            system.ingest_routes_shared, [route.dict() for route in routes], MODEL_PATH, INGESTED_DATA_PATH
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def select_system(model_version: Optional[str] = Query(None),
+                        x_model_version: Optional[str] = Header(None)) -> CargoRecommendationSystem:
+    """Система рекомендаций для запроса: рабочая или версия из заголовка X-Model-Version / параметра model_version"""
+    name = x_model_version or model_version
+    if not name:
+        return recommendation_system
+    try:
+        version = model_registry.resolve(name)
+        # Рабочая модель уже загружена, вторая копия не нужна
+        if version == recommendation_system.model_version:
+            return recommendation_system
+        return await run_in_threadpool(model_registry.get, version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Model version not found: {name}")
+
+def resolve_sections(sections: Optional[List[str]]) -> List[str]:
+    """Запрошенные разделы сводной рекомендации (по умолчанию все)"""
+    sections = list(RECOMMENDATION_SECTIONS) if not sections else sections
+    unknown = [section for section in sections if section not in RECOMMENDATION_SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(unknown)}")
+    return sections
+
+@app.post("/recommend")
+async def recommend(cargo_data: CargoData, sections: Optional[List[str]] = Query(None),
+                    system: CargoRecommendationSystem = Depends(select_system)):
+    sections = resolve_sections(sections)
+    if "routes" in sections and system.model is None:
+        raise HTTPException(status_code=400, detail="Model not trained. Please train the model first.")
+    # Поиск пути по сети может занять заметное время, поэтому идет в пуле потоков
+    cargo = await run_in_threadpool(cargo_features, cargo_data)
+    try:
+        # Кешируются только маршруты: разделы правил зависят от точных значений
+        # признаков (пороги, текущая стоимость) и вычисляются для каждого запроса.
+        # Матрица признаков строится один раз для маршрутов и правил
+        matrix = cargo_matrix([cargo])
+        result = {}
+        if "routes" in sections:
+            result["routes"] = response_cache.get_or_compute(
+                "route", cargo, system.revision, lambda: system.recommend_all_matrix(matrix, ["routes"])[0]["routes"]
+            )
+        result.update(system.recommend_all_matrix(matrix, [section for section in sections if section != "routes"])[0])
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/recommend/bulk")
+async def recommend_bulk(request: Request, format: Optional[str] = None, sections: Optional[List[str]] = Query(None),
+                         chunk_size: int = Query(DEFAULT_CHUNK_SIZE, ge=1, le=100_000),
+                         system: CargoRecommendationSystem = Depends(select_system)):
+    """Сводные рекомендации для файла грузов (CSV или NDJSON) с потоковой выдачей NDJSON.
+
+    Файл передается как multipart-поле file или непосредственно телом запроса.
+    Multipart-тело разбирается по мере поступления, без сохранения файла целиком.
+    """
+    sections = resolve_sections(sections)
+    if "routes" in sections and system.model is None:
+        raise HTTPException(status_code=400, detail="Model not trained. Please train the model first.")
+
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        try:
+            upload = MultipartUpload(request.stream(), content_type)
+            await upload.open()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="File field 'file' is required")
+        stream = upload.iter_data()
+        fmt = format or detect_format(upload.filename, upload.content_type)
+    else:
+        stream = request.stream()
+        fmt = format or detect_format(content_type=content_type)
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {fmt}")
+
+    return BodyStreamingResponse(stream_recommendations(system, stream, fmt, sections, chunk_size, network))
+
+@app.post("/recommend/route")
+async def get_route_recommendations(cargo_data: CargoData, system: CargoRecommendationSystem = Depends(select_system)):
+    if system.model is None:
+        raise HTTPException(status_code=400, detail="Model not trained. Please train the model first.")
+    cargo = await run_in_threadpool(cargo_features, cargo_data)
+    try:
+        recommendations = response_cache.get_or_compute(
+            "route", cargo, system.revision, lambda: system.get_route_recommendations(cargo)
+        )
+        return {"recommendations": recommendations}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/recommend/route/batch")
+async def get_route_recommendations_batch(cargo_batch: List[CargoData],
+                                          system: CargoRecommendationSystem = Depends(select_system)):
+    if system.model is None:
+        raise HTTPException(status_code=400, detail="Model not trained. Please train the model first.")
+    cargo_list = await run_in_threadpool(lambda: [cargo_features(cargo_data) for cargo_data in cargo_batch])
+    try:
+        recommendations = system.get_route_recommendations_batch(cargo_list)
+        return {"recommendations": recommendations}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/recommend/route/similar")
+async def find_similar_routes(cargo_data: CargoData, k: int = Query(5, ge=1, le=MAX_SIMILAR_ROUTES),
+                              n_probe: int = Query(8, ge=1), success_weight: float = 0.0,
+                              system: CargoRecommendationSystem = Depends(select_system)):
+    if system.model is None:
+        raise HTTPException(status_code=400, detail="Model not trained. Please train the model first.")
+    cargo = await run_in_threadpool(cargo_features, cargo_data)
+    try:
+        routes = system.find_similar_routes(cargo, k=k, n_probe=n_probe, success_weight=success_weight)
+        return {"recommendations": routes}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/recommend/vehicle")
+async def get_vehicle_recommendations(cargo_data: CargoData, system: CargoRecommendationSystem = Depends(select_system)):
+    cargo = await run_in_threadpool(cargo_features, cargo_data)
+    try:
+        recommendations = system.get_vehicle_recommendations(cargo)
+        return {"recommendations": recommendations}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/optimize/cost")
+async def get_cost_optimization(cargo_data: CargoData, system: CargoRecommendationSystem = Depends(select_system)):
+    cargo = await run_in_threadpool(cargo_features, cargo_data)
+    try:
+        # Набор сработавших правил кешируется в RuleEngine, а стоимость и экономия
+        # считаются по самому запросу, поэтому общий кеш ответов здесь не нужен
+        return system.get_cost_optimization(cargo)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/recommend/weather")
+async def get_weather_recommendations(cargo_data: CargoData, system: CargoRecommendationSystem = Depends(select_system)):
+    cargo = await run_in_threadpool(cargo_features, cargo_data)
+    try:
+        return system.get_weather_recommendations(cargo)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/plan")
+async def plan_loads(shipments: List[ShipmentData],
+                     band_width: float = Query(DEFAULT_BAND_WIDTH, gt=0),
+                     stop_hours: float = Query(DEFAULT_STOP_HOURS, ge=0),
+                     max_delay: float = Query(DEFAULT_MAX_DELAY, ge=0),
+                     time_budget: float = Query(DEFAULT_TIME_BUDGET, gt=0, le=60),
+                     n_jobs: Optional[int] = Query(None, ge=1)):
+    """План консолидации грузов за день по рейсам с итоговой стоимостью и экономией"""
+    system = recommendation_system
+    def plan():
+        cargo_list = []
+        for i, shipment in enumerate(shipments):
+            cargo = cargo_features(shipment)
+            cargo["shipment_id"] = shipment.shipment_id if shipment.shipment_id is not None else str(i)
+            cargo_list.append(cargo)
+        return system.plan_loads(cargo_list, band_width=band_width, stop_hours=stop_hours, max_delay=max_delay,
+                                 time_budget=time_budget, n_jobs=n_jobs)
+    try:
+        return await run_in_threadpool(plan)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/health")
+async def health():
+    system = recommendation_system
+    return {"status": "ok", "model_loaded": system.model is not None, "model_version": system.model_version}
+
+@app.get("/model/info")
+async def get_model_info(system: CargoRecommendationSystem = Depends(select_system)):
+    try:
+        if system.model is None:
+            return {"status": "Model not trained"}
+        return {
+            "status": "Model trained",
+            "model_version": system.model_version,
+            "n_clusters": system.model.n_clusters,
+            "n_samples": system.n_samples,
+            "k_selection": system.k_selection
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/rules/reload")
+async def reload_rules():
+    system = recommendation_system
+    try:
+        system.reload_rules()
+        for loaded in model_registry.loaded():
+            loaded.reload_rules()
+        return {"message": "Rules reloaded"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    metrics.update_model_gauges(recommendation_system)
+    return PlainTextResponse(metrics.REGISTRY.render(METRICS_DIR), media_type="text/plain; version=0.0.4")
+
+@app.get("/models")
+async def list_models():
+    try:
+        versions = []
+        for version in model_artifact.list_versions(MODEL_PATH):
+            manifest = model_artifact.read_manifest(MODEL_PATH, version)
+            versions.append({key: manifest.get(key) for key in ("model_version", "created_at", "n_clusters", "n_samples")})
+        return {
+            "latest": model_artifact.latest_version(MODEL_PATH),
+            "serving": recommendation_system.model_version,
+            "aliases": model_artifact.read_aliases(MODEL_PATH),
+            "versions": versions,
+            "registry": model_registry.stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/models/aliases/{alias}")
+async def set_model_alias(alias: str, version: str):
+    try:
+        model_artifact.set_alias(MODEL_PATH, alias, version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"alias": alias, "model_version": version}
+
+@app.delete("/models/aliases/{alias}")
+async def delete_model_alias(alias: str):
+    if not model_artifact.remove_alias(MODEL_PATH, alias):
+        raise HTTPException(status_code=404, detail="Alias not found")
+    return {"message": "Alias removed"}
+
+@app.get("/network")
+async def get_network_info():
+    if network is None:
+        return {"status": "Road network is not configured"}
+    return network.stats()
+
+@app.get("/network/route")
+async def get_network_route(origin: int, destination: int):
+    if network is None:
+        raise HTTPException(status_code=400, detail="Road network is not configured")
+    try:
+        route = await run_in_threadpool(network.route, origin, destination)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"origin": origin, "destination": destination, **route}
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return response_cache.stats()
+
+if __name__ == "__main__":
     uvicorn.run("api:app", host="127.0.0.1", port=8000, reload=True) 
\ No newline at end of file
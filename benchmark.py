@@ -0,0 +1,209 @@
+import argparse
+import inspect
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000, 10_000_000]
+
+# Холодный старт обслуживающего процесса; выполняется в новом интерпретаторе,
+# чтобы уже импортированные модули не искажали замер. Перед скриптом
+# подставляется исходный код peak_rss_mb: импорт benchmark загрузил бы pandas
+STARTUP_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+from recommendation_system import CargoRecommendationSystem
+import_s = time.perf_counter() - start
+system = CargoRecommendationSystem()
+system.load_model(sys.argv[1], inference_only=sys.argv[2] == '1')
+load_s = time.perf_counter() - start - import_s
+system.get_route_recommendations({'weight': 1000.0, 'distance': 500.0, 'delivery_time': 10.0, 'cost': 5000.0})
+total_s = time.perf_counter() - start
+print(json.dumps({
+    'import_s': import_s,
+    'load_model_s': load_s,
+    'first_query_s': total_s - import_s - load_s,
+    'total_s': total_s,
+    'peak_rss_mb': peak_rss_mb(),
+    'sklearn_imported': 'sklearn' in sys.modules,
+    'matplotlib_imported': 'matplotlib' in sys.modules
+}))
+"""
+
+def generate_cargo_data(n_rows: int, seed: int = 42) -> pd.DataFrame:
+    """Синтетические данные в формате cargo_data.csv"""
+    rng = np.random.default_rng(seed)
+    distance = rng.gamma(2.0, 250.0, n_rows).clip(5, 5000).round()
+    weight = rng.lognormal(7.5, 1.0, n_rows).clip(50, 40000).round()
+    delivery_time = (distance / rng.uniform(45, 75, n_rows) + rng.uniform(0.5, 4, n_rows)).round(1)
+    cost = (distance * rng.uniform(6, 12, n_rows) + weight * rng.uniform(0.2, 0.6, n_rows)).round()
+    success_rate = (0.98 - distance / 20000 - rng.uniform(0, 0.08, n_rows)).clip(0.5, 1).round(2)
+    return pd.DataFrame({
+        'route_id': np.arange(1, n_rows + 1),
+        'weight': weight,
+        'distance': distance,
+        'delivery_time': delivery_time,
+        'cost': cost,
+        'success_rate': success_rate
+    })
+
+def write_dataset(n_rows: int, path: str):
+    generate_cargo_data(n_rows).to_csv(path, index=False)
+
+def peak_rss_mb() -> float:
+    """Пиковый объем резидентной памяти процесса (МБ).
+
+    В Linux берется VmHWM из /proc/self/status: ru_maxrss сохраняется при exec,
+    и дочерний процесс сообщил бы пик родителя, если тот был больше.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В Linux ru_maxrss измеряется в килобайтах, в macOS - в байтах
+    return usage / 1024 / 1024 if sys.platform == 'darwin' else usage / 1024
+
+def latency_stats(samples: List[float]) -> Dict:
+    """Перцентили задержки в миллисекундах"""
+    ms = np.array(samples) * 1000
+    return {
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'mean_ms': float(ms.mean()),
+        'n': len(samples)
+    }
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def measure_startup(model_path: str, inference_only: bool) -> Dict:
+    """Время импорта, загрузки модели и первого запроса в новом процессе"""
+    script = inspect.getsource(peak_rss_mb) + STARTUP_SCRIPT
+    output = subprocess.check_output(
+        [sys.executable, '-c', script, os.path.abspath(model_path), '1' if inference_only else '0'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+def measure_startup_modes(model_path: str) -> Dict:
+    return {
+        'full': measure_startup(model_path, inference_only=False),
+        'inference_only': measure_startup(model_path, inference_only=True)
+    }
+
+def run_size(n_rows: int, data_path: str, n_queries: int, batch_size: int, streaming: bool, workdir: str) -> Dict:
+    """Замер одного размера данных; выполняется в отдельном процессе ради честного пика RSS"""
+    import warnings
+    warnings.filterwarnings('ignore')
+    from recommendation_system import CargoRecommendationSystem
+
+    rss_before = peak_rss_mb()
+
+    system = CargoRecommendationSystem()
+    if streaming:
+        load_time = 0.0
+        _, train_time = timed(system.train_model_streaming, data_path)
+    else:
+        _, load_time = timed(system.load_data, data_path)
+        _, train_time = timed(system.train_model)
+    rss_train = peak_rss_mb()
+
+    model_path = os.path.join(workdir, f"model_{n_rows}")
+    _, save_time = timed(system.save_model, model_path)
+    loaded = CargoRecommendationSystem()
+    _, load_model_time = timed(loaded.load_model, model_path)
+    startup = measure_startup_modes(model_path)
+
+    queries = generate_cargo_data(max(n_queries, batch_size), seed=7).to_dict('records')
+    loaded.get_route_recommendations(queries[0])
+
+    single = []
+    for cargo in queries[:n_queries]:
+        _, elapsed = timed(loaded.get_route_recommendations, cargo)
+        single.append(elapsed)
+
+    batch = []
+    for _ in range(max(1, n_queries // 10)):
+        _, elapsed = timed(loaded.get_route_recommendations_batch, queries[:batch_size])
+        batch.append(elapsed)
+
+    return {
+        'n_rows': n_rows,
+        'streaming': streaming,
+        'load_data_s': load_time,
+        'train_model_s': train_time,
+        'peak_rss_mb_before_train': rss_before,
+        'peak_rss_mb_after_train': rss_train,
+        'save_model_s': save_time,
+        'load_model_s': load_model_time,
+        'startup': startup,
+        'route_single': latency_stats(single),
+        'route_batch': {**latency_stats(batch), 'batch_size': batch_size}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк системы рекомендаций на синтетических данных")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Размеры наборов данных (строк)")
+    parser.add_argument('--queries', type=int, default=1000, help="Число одиночных запросов на размер")
+    parser.add_argument('--batch-size', type=int, default=100, help="Размер пакета для пакетного запроса")
+    parser.add_argument('--streaming', action='store_true', help="Обучать потоково (train_model_streaming)")
+    parser.add_argument('--output', default='benchmark_results.json', help="Файл с результатами")
+    parser.add_argument('--startup', metavar='MODEL_PATH', default=None,
+                        help="Только замерить холодный старт для сохраненной модели (полная загрузка и только вывод)")
+    args = parser.parse_args()
+
+    if args.startup:
+        print(json.dumps(measure_startup_modes(args.startup), ensure_ascii=False, indent=2))
+        return
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_rows in args.sizes:
+            print(f"Размер {n_rows}...")
+            data_path = os.path.join(workdir, f"cargo_{n_rows}.csv")
+            # Генерация данных и каждый замер идут в новых процессах,
+            # чтобы пик памяти не переносился между этапами и размерами
+            with context.Pool(1) as pool:
+                pool.apply(write_dataset, (n_rows, data_path))
+            with context.Pool(1) as pool:
+                result = pool.apply(run_size, (n_rows, data_path, args.queries, args.batch_size, args.streaming, workdir))
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+            results.append(result)
+
+    import sklearn
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'sklearn': sklearn.__version__
+        },
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import io
+import json
+from typing import AsyncIterator, List, Optional, TYPE_CHECKING
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+
+from route_index import FEATURES
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:
+    # python-multipart до 0.0.13 устанавливает модуль под именем multipart
+    from multipart.multipart import MultipartParser, parse_options_header
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+FORMATS = ('csv', 'ndjson')
+# Строк в одной порции, для которой рекомендации считаются одним векторным вызовом
+DEFAULT_CHUNK_SIZE = 10_000
+# Узлы дорожной сети, по которым рассчитываются отсутствующие distance и delivery_time
+ROUTE_COLUMNS = ['origin', 'destination']
+ROUTED_FEATURES = ['distance', 'delivery_time']
+
+class BodyStreamingResponse(StreamingResponse):
+    """Потоковый ответ, генератор которого продолжает читать тело запроса.
+
+    Обычный StreamingResponse параллельно ждет отключения клиента через
+    receive() и забирает себе сообщения с телом запроса. Здесь отключение
+    обнаруживается при чтении тела или при отправке ответа.
+    """
+    media_type = 'application/x-ndjson'
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+def detect_format(filename: Optional[str] = None, content_type: Optional[str] = None) -> str:
+    """Формат входного потока по имени файла или типу содержимого (по умолчанию CSV)"""
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')) or 'ndjson' in (content_type or '') or 'jsonl' in (content_type or ''):
+        return 'ndjson'
+    return 'csv'
+
+async def iter_line_chunks(stream: AsyncIterator[bytes], chunk_size: int) -> AsyncIterator[List[bytes]]:
+    """Порции по chunk_size непустых строк из потока байтов.
+
+    В памяти находятся только текущая порция и незавершенная строка,
+    поэтому расход памяти не зависит от размера файла.
+    """
+    lines = []
+    tail = b''
+    async for block in stream:
+        if not block:
+            continue
+        parts = (tail + block).split(b'\n')
+        tail = parts.pop()
+        for line in parts:
+            line = line.strip()
+            if line:
+                lines.append(line)
+                if len(lines) >= chunk_size:
+                    yield lines
+                    lines = []
+    tail = tail.strip()
+    if tail:
+        lines.append(tail)
+    if lines:
+        yield lines
+
+def parse_lines(lines: List[bytes], fmt: str, header: Optional[bytes] = None, network=None) -> 'pd.DataFrame':
+    """Таблица признаков из порции строк; некорректные значения становятся NaN.
+
+    Если задана дорожная сеть, distance и delivery_time можно не передавать:
+    они рассчитываются по столбцам origin и destination.
+    """
+    import pandas as pd
+    columns = FEATURES + ROUTE_COLUMNS
+    if fmt == 'csv':
+        frame = pd.read_csv(io.BytesIO(b'\n'.join([header] + lines)), usecols=lambda c: c in columns)
+    else:
+        records = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            records.append(record if isinstance(record, dict) else {})
+        frame = pd.DataFrame.from_records(records, columns=columns)
+    routed = network is not None and all(c in frame for c in ROUTE_COLUMNS)
+    missing = [f for f in FEATURES if f not in frame and not (routed and f in ROUTED_FEATURES)]
+    if missing:
+        raise ValueError(f"Во входных данных нет столбцов: {', '.join(missing)}")
+    frame = frame.reindex(columns=columns).apply(pd.to_numeric, errors='coerce')
+    if routed:
+        fill_routes(frame, network)
+    return frame[FEATURES]
+
+def fill_routes(frame: 'pd.DataFrame', network):
+    """Расчет незаполненных distance и delivery_time по дорожной сети (на месте)"""
+    pending = frame[ROUTED_FEATURES].isna().any(axis=1) & frame[ROUTE_COLUMNS].notna().all(axis=1)
+    if not pending.any():
+        return
+    rows = frame[pending]
+    routes = np.column_stack(network.routes(rows['origin'].astype(np.int64).tolist(),
+                                            rows['destination'].astype(np.int64).tolist()))
+    given = rows[ROUTED_FEATURES].to_numpy()
+    frame.loc[pending, ROUTED_FEATURES] = np.where(np.isnan(given), routes, given)
+
+def recommend_chunk(system, frame: 'pd.DataFrame', first_row: int, sections: Optional[List[str]]) -> bytes:
+    """Рекомендации для порции в виде строк NDJSON (номер строки данных - поле row)"""
+    features = frame.to_numpy(dtype=float)
+    valid = np.isfinite(features).all(axis=1)
+    results = iter(system.recommend_all_matrix(features[valid], sections))
+    out = []
+    for row, ok in enumerate(valid.tolist(), start=first_row):
+        if ok:
+            record = {'row': row, **next(results)}
+        else:
+            record = {'row': row, 'error': "Некорректные или отсутствующие признаки груза"}
+        out.append(json.dumps(record, ensure_ascii=False))
+    return ('\n'.join(out) + '\n').encode('utf-8')
+
+async def stream_recommendations(system, stream: AsyncIterator[bytes], fmt: str,
+                                 sections: Optional[List[str]] = None,
+                                 chunk_size: int = DEFAULT_CHUNK_SIZE, network=None) -> AsyncIterator[bytes]:
+    """Потоковые рекомендации: ответ на каждую порцию отправляется, не дожидаясь конца входных данных"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    header = None
+    first_row = 0
+    try:
+        async for lines in iter_line_chunks(stream, chunk_size):
+            if fmt == 'csv' and header is None:
+                header, lines = lines[0], lines[1:]
+                if not lines:
+                    continue
+            # Разбор и расчет идут в пуле потоков, чтобы не блокировать цикл событий
+            frame = await run_in_threadpool(parse_lines, lines, fmt, header, network)
+            yield await run_in_threadpool(recommend_chunk, system, frame, first_row, sections)
+            first_row += len(lines)
+    except ValueError as e:
+        # Заголовки ответа уже отправлены, поэтому ошибка передается последней строкой потока
+        yield (json.dumps({'row': first_row, 'error': str(e)}, ensure_ascii=False) + '\n').encode('utf-8')
+
+class MultipartUpload:
+    """Поле файла из тела multipart/form-data, разбираемое по мере поступления.
+
+    Тело подается в MultipartParser блоками из потока запроса, и данные поля
+    сразу передаются дальше. В отличие от request.form(), файл не
+    сохраняется целиком ни в памяти, ни во временном файле.
+    """
+
+    def __init__(self, stream: AsyncIterator[bytes], content_type: str, field: str = 'file'):
+        _, options = parse_options_header(content_type)
+        boundary = options.get(b'boundary')
+        if not boundary:
+            raise ValueError("В заголовке Content-Type нет boundary")
+        self.filename = None
+        self.content_type = None
+        self._stream = stream.__aiter__()
+        self._field = field.encode()
+        self._found = False
+        self._in_field = False
+        self._done = False
+        self._blocks = []
+        self._headers = {}
+        self._header_field = b''
+        self._header_value = b''
+        self._parser = MultipartParser(boundary, {
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b''
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        # Используется первое поле с нужным именем, остальные части пропускаются
+        if options.get(b'name') == self._field and not self._found:
+            self._found = self._in_field = True
+            self.filename = options.get(b'filename', b'').decode('utf-8', errors='replace')
+            self.content_type = self._headers.get(b'content-type', b'').decode('latin-1')
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_field:
+            self._blocks.append(bytes(data[start:end]))
+
+    def _on_part_end(self):
+        if self._in_field:
+            self._in_field = False
+            self._done = True
+
+    async def _feed(self) -> bool:
+        """Передача разборщику следующего блока тела; False, если тело закончилось"""
+        try:
+            block = await self._stream.__anext__()
+        except StopAsyncIteration:
+            self._parser.finalize()
+            return False
+        self._parser.write(block)
+        return True
+
+    async def open(self):
+        """Чтение тела до заголовков поля файла (имя и тип файла становятся известны)"""
+        while not self._found:
+            if not await self._feed():
+                raise ValueError(f"В запросе нет поля {self._field.decode()}")
+
+    async def iter_data(self) -> AsyncIterator[bytes]:
+        """Содержимое поля файла блоками по мере поступления тела запроса"""
+        while True:
+            blocks, self._blocks = self._blocks, []
+            for block in blocks:
+                yield block
+            if self._done or not await self._feed():
+                return
@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.metrics import silhouette_score
+
+# Диапазон числа кластеров, перебираемый по умолчанию
+DEFAULT_K_RANGE = range(2, 21)
+# Размер подвыборки, на которой оценивается каждое k
+DEFAULT_SAMPLE_SIZE = 10_000
+# Силуэт считается за O(n^2), поэтому оценивается на меньшей части подвыборки
+SILHOUETTE_SAMPLE_SIZE = 3_000
+
+def score_k(X, k: int, random_state: int = 42) -> Dict:
+    """Обучение KMeans с k кластерами на подвыборке и расчет оценок"""
+    model = KMeans(n_clusters=k, random_state=random_state, n_init=3)
+    labels = model.fit_predict(X)
+    silhouette = float(silhouette_score(
+        X, labels, sample_size=min(SILHOUETTE_SAMPLE_SIZE, len(X)), random_state=random_state
+    ))
+    return {'k': k, 'silhouette': silhouette, 'inertia': float(model.inertia_)}
+
+def elbow_k(ks, inertia) -> int:
+    """Точка излома кривой инерции: максимальное отклонение от хорды между крайними точками"""
+    x = np.asarray(ks, dtype=float)
+    y = np.asarray(inertia, dtype=float)
+    if len(x) < 3:
+        return int(x[0])
+    x = (x - x[0]) / (x[-1] - x[0])
+    y = (y - y.min()) / ((y.max() - y.min()) or 1.0)
+    # Хорда идет из (0, y[0]) в (1, y[-1]); расстояние до нее для каждой точки
+    distance = np.abs((y[-1] - y[0]) * x - y + y[0])
+    return int(ks[int(np.argmax(distance))])
+
+def select_n_clusters(X, k_range: Iterable[int] = DEFAULT_K_RANGE, sample_size: int = DEFAULT_SAMPLE_SIZE,
+                      method: str = 'silhouette', n_jobs: Optional[int] = None, random_state: int = 42) -> Dict:
+    """Выбор числа кластеров по силуэту или по излому инерции.
+
+    Каждое k оценивается на одной и той же подвыборке, поэтому стоимость не
+    зависит от размера данных. Значения k оцениваются параллельно в пуле
+    процессов (на одноядерной машине - последовательно).
+    """
+    if method not in ('silhouette', 'elbow'):
+        raise ValueError(f"Неизвестный метод выбора числа кластеров: {method}")
+    start = time.perf_counter()
+
+    X = np.asarray(X)
+    if len(X) > sample_size:
+        rng = np.random.default_rng(random_state)
+        X = X[rng.choice(len(X), size=sample_size, replace=False)]
+    ks = [k for k in k_range if 1 < k < len(X)]
+    if not ks:
+        raise ValueError("Недостаточно данных для выбора числа кластеров")
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(ks))
+    if n_jobs > 1:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context) as executor:
+            results = list(executor.map(score_k, [X] * len(ks), ks, [random_state] * len(ks)))
+    else:
+        results = [score_k(X, k, random_state) for k in ks]
+
+    if method == 'silhouette':
+        best_k = max(results, key=lambda r: r['silhouette'])['k']
+    else:
+        best_k = elbow_k(ks, [r['inertia'] for r in results])
+
+    return {
+        'best_k': int(best_k),
+        'method': method,
+        'sample_size': int(len(X)),
+        'n_jobs': n_jobs,
+        'scores': {str(r['k']): {'silhouette': r['silhouette'], 'inertia': r['inertia']} for r in results},
+        'elapsed_s': time.perf_counter() - start
+    }
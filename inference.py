@@ -0,0 +1,40 @@
+import numpy as np
+
+class ArrayScaler:
+    """Масштабирование по сохраненным среднему и разбросу (замена StandardScaler для вывода)"""
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray):
+        self.mean_ = np.asarray(mean, dtype=np.float64)
+        self.scale_ = np.asarray(scale, dtype=np.float64)
+
+    def transform(self, X) -> np.ndarray:
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+class NearestCentroidModel:
+    """Отнесение к ближайшему центру кластера (замена KMeans.predict для вывода)"""
+
+    def __init__(self, cluster_centers: np.ndarray):
+        self.cluster_centers_ = np.asarray(cluster_centers, dtype=np.float64)
+
+    @property
+    def n_clusters(self) -> int:
+        return len(self.cluster_centers_)
+
+    def predict(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2; |x|^2 не влияет на выбор центра
+        distances = (self.cluster_centers_ ** 2).sum(axis=1) - 2 * X @ self.cluster_centers_.T
+        return distances.argmin(axis=1).astype(np.int32)
+
+def export_arrays(scaler, model) -> dict:
+    """Параметры скейлера и центры кластеров в виде массивов NumPy для артефакта"""
+    return {
+        'scaler_mean': np.asarray(scaler.mean_, dtype=np.float64),
+        'scaler_scale': np.asarray(scaler.scale_, dtype=np.float64),
+        'cluster_centers': np.asarray(model.cluster_centers_, dtype=np.float64)
+    }
+
+def from_arrays(arrays: dict):
+    """Скейлер и модель для вывода из массивов артефакта"""
+    return (ArrayScaler(arrays['scaler_mean'], arrays['scaler_scale']),
+            NearestCentroidModel(arrays['cluster_centers']))
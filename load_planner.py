@@ -0,0 +1,329 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rules import RuleEngine, cargo_matrix, matrix_columns
+
+# Ширина полосы расстояний: грузы из разных полос не объединяются в один рейс
+DEFAULT_BAND_WIDTH = 100.0
+# Задержка на каждую дополнительную точку выгрузки (в единицах delivery_time)
+DEFAULT_STOP_HOURS = 0.5
+# Насколько доставка в общем рейсе может опоздать относительно срока самого срочного груза
+DEFAULT_MAX_DELAY = 4.0
+# Время на упаковку всего плана (секунды)
+DEFAULT_TIME_BUDGET = 1.0
+# Меньшие планы решаются в текущем процессе: передача полос в пул дороже самого решения
+PARALLEL_MIN_SHIPMENTS = 2_000
+
+# Пул для больших планов создается при первом таком плане и живет до остановки
+# процесса, поэтому запросы не тратят свое время на запуск рабочих процессов
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+class _Packing:
+    """Рейсы одной полосы: загрузка и самый ранний и поздний сроки доставки каждого"""
+
+    def __init__(self, weight: np.ndarray, delivery_time: np.ndarray, capacity: float,
+                 stop_hours: float, max_delay: float):
+        self.weight = weight
+        self.delivery_time = delivery_time
+        self.capacity = capacity
+        self.stop_hours = stop_hours
+        self.max_delay = max_delay
+        n = len(weight)
+        self.load = np.zeros(n)
+        self.earliest = np.zeros(n)
+        self.latest = np.zeros(n)
+        self.count = np.zeros(n)
+        self.alive = np.zeros(n, dtype=bool)
+        self.bins = []
+
+    def fits(self, i: int, start: int = 0) -> np.ndarray:
+        """Рейсы начиная со start, в которые можно добавить груз i"""
+        m = len(self.bins)
+        w, t = self.weight[i], self.delivery_time[i]
+        return (self.alive[start:m] & (self.load[start:m] + w <= self.capacity)
+                & (np.maximum(self.latest[start:m], t) + self.stop_hours * self.count[start:m]
+                   <= np.minimum(self.earliest[start:m], t) + self.max_delay))
+
+    def first(self, i: int, start: int = 0) -> int:
+        """Первый подходящий рейс (len(bins) - нужен новый)"""
+        candidates = self.fits(i, start)
+        b = int(candidates.argmax()) if len(candidates) else 0
+        return start + b if len(candidates) and candidates[b] else len(self.bins)
+
+    def place(self, i: int, b: int):
+        if b == len(self.bins):
+            self.bins.append([])
+            self.alive[b] = True
+            self.earliest[b] = self.latest[b] = self.delivery_time[i]
+        self.bins[b].append(i)
+        self.load[b] += self.weight[i]
+        self.earliest[b] = min(self.earliest[b], self.delivery_time[i])
+        self.latest[b] = max(self.latest[b], self.delivery_time[i])
+        self.count[b] += 1
+
+    def first_fit(self, order: List[int], deadline: float) -> bool:
+        """Размещение грузов по порядку; после deadline проверяется только последний рейс (next-fit)"""
+        timed_out = False
+        for i in order:
+            start = max(len(self.bins) - 1, 0) if timed_out else 0
+            self.place(i, self.first(i, start))
+            timed_out = timed_out or time.perf_counter() > deadline
+        return timed_out
+
+    def dissolve(self, deadline: float):
+        """Расформирование рейсов, начиная с наименее загруженных, если их грузы помещаются в другие"""
+        for b in np.argsort(self.load[:len(self.bins)], kind='stable').tolist():
+            if time.perf_counter() > deadline:
+                break
+            state = (self.load.copy(), self.earliest.copy(), self.latest.copy(), self.count.copy())
+            self.alive[b] = False
+            moved = []
+            for i in self.bins[b]:
+                target = self.first(i)
+                if target == len(self.bins):
+                    break
+                moved.append(target)
+                self.place(i, target)
+            if len(moved) == len(self.bins[b]):
+                self.bins[b] = []
+                continue
+            # Не все грузы поместились: рейс остается как был
+            self.load, self.earliest, self.latest, self.count = state
+            self.alive[b] = True
+            for target in moved:
+                self.bins[target].pop()
+
+def pack_band(weight: np.ndarray, delivery_time: np.ndarray, capacity: float,
+              stop_hours: float = DEFAULT_STOP_HOURS, max_delay: float = DEFAULT_MAX_DELAY,
+              time_budget: float = DEFAULT_TIME_BUDGET) -> Tuple[List[List[int]], bool]:
+    """Распределение грузов полосы по рейсам; возвращает рейсы (номера грузов) и признак нехватки времени.
+
+    Груз добавляется в рейс, если хватает грузоподъемности и выполняется
+    ограничение по времени max(delivery_time) + stop_hours * (n - 1) <=
+    min(delivery_time) + max_delay. First-fit выполняется для двух порядков:
+    по убыванию веса (лучше, когда ограничивает грузоподъемность) и по сроку
+    доставки (лучше, когда ограничивает время), остается план с меньшим
+    числом рейсов. В оставшееся время наименее загруженные рейсы
+    расформировываются, если их грузы помещаются в другие. Если время
+    кончилось во время упаковки, оставшиеся грузы кладутся next-fit.
+    """
+    deadline = time.perf_counter() + time_budget
+    best = None
+    timed_out = False
+    for order in (np.argsort(-weight, kind='stable'), np.argsort(delivery_time, kind='stable')):
+        packing = _Packing(weight, delivery_time, capacity, stop_hours, max_delay)
+        timed_out = packing.first_fit(order.tolist(), deadline)
+        if best is None or len(packing.bins) < len(best.bins):
+            best = packing
+        if timed_out:
+            break
+    best.dissolve(deadline)
+    return [items for items in best.bins if items], timed_out
+
+def solve_band(weight: np.ndarray, delivery_time: np.ndarray, capacity: float, stop_hours: float,
+               max_delay: float, time_budget: float, deadline: float) -> Tuple[List[List[int]], bool, float]:
+    """Упаковка одной полосы (выполняется в пуле процессов); третье значение - время решения.
+
+    time_budget - доля полосы во времени плана, deadline - срок всего плана
+    по time.time() (общие часы для всех процессов пула).
+    """
+    start = time.perf_counter()
+    time_budget = max(min(time_budget, deadline - time.time()), 0.0)
+    bins, timed_out = pack_band(weight, delivery_time, capacity, stop_hours, max_delay, time_budget)
+    return bins, timed_out, time.perf_counter() - start
+
+def _ready(_: int) -> bool:
+    return True
+
+def planner_pool(n_jobs: int) -> ProcessPoolExecutor:
+    """Общий пул упаковки полос не меньше чем на n_jobs процессов.
+
+    Новый пул запускается и прогревается (процессы импортируют модуль) до
+    возврата, чтобы запуск не входил в время на решение плана.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers < n_jobs:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool_workers = max(n_jobs, os.cpu_count() or 1)
+            _pool = ProcessPoolExecutor(max_workers=_pool_workers, mp_context=multiprocessing.get_context('spawn'))
+            list(_pool.map(_ready, range(_pool_workers)))
+        return _pool
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_pool():
+    """Остановка пула упаковки полос"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def vehicle_catalog(rules: RuleEngine) -> List[Dict]:
+    """Транспорт из таблицы правил, для которого указаны грузоподъемность и расход топлива"""
+    catalog = [{
+        'rule': i,
+        'vehicle_type': rule['recommendation']['vehicle_type'],
+        'capacity_kg': float(rule['capacity_kg']),
+        'fuel_l_per_100km': float(rule['fuel_l_per_100km'])
+    } for i, rule in enumerate(rules.vehicles) if 'capacity_kg' in rule and 'fuel_l_per_100km' in rule]
+    if not catalog:
+        raise ValueError("В таблице правил нет транспорта с capacity_kg и fuel_l_per_100km")
+    return catalog
+
+def choose_vehicles(rules: RuleEngine, catalog: List[Dict], columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Транспорт для рейсов: самый экономичный из подходящих по правилам и грузоподъемности.
+
+    Если ни одно правило не подходит, выбирается самый грузоподъемный транспорт.
+    """
+    conditions = rules.vehicle_conditions(columns)[[v['rule'] for v in catalog]]
+    capacity = np.array([v['capacity_kg'] for v in catalog])
+    fuel = np.array([v['fuel_l_per_100km'] for v in catalog])
+    eligible = conditions & (capacity[:, None] >= columns['weight'])
+    choice = np.where(eligible, fuel[:, None], np.inf).argmin(axis=0)
+    return np.where(eligible.any(axis=0), choice, int(capacity.argmax()))
+
+def trip_costs(trips: List[np.ndarray], vehicle_fuel: np.ndarray, columns: Dict[str, np.ndarray],
+               own_fuel: np.ndarray) -> np.ndarray:
+    """Стоимость рейсов выбранным транспортом.
+
+    Стоимость груза пересчитывается на транспорт рейса пропорционально
+    расходу топлива относительно рекомендованного для груза транспорта
+    (own_fuel, 0 - неизвестен, пересчета нет) и на длину рейса
+    пропорционально расстоянию. Стоимость рейса - наибольшая из пересчитанных:
+    рейс один раз проходит самый длинный путь полосы.
+    """
+    if not trips:
+        return np.zeros(0)
+    sizes = np.array([len(t) for t in trips])
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    items = np.concatenate(trips)
+    distance = columns['distance'][items]
+    own = own_fuel[items]
+    ratio = np.divide(np.repeat(vehicle_fuel, sizes), own, out=np.ones(len(items)), where=own > 0)
+    length = np.divide(np.repeat(np.maximum.reduceat(distance, starts), sizes), distance,
+                       out=np.ones(len(items)), where=distance > 0)
+    return np.maximum.reduceat(columns['cost'][items] * ratio * length, starts)
+
+def plan_loads(rules: RuleEngine, cargo_list: List[Dict], band_width: float = DEFAULT_BAND_WIDTH,
+               stop_hours: float = DEFAULT_STOP_HOURS, max_delay: float = DEFAULT_MAX_DELAY,
+               time_budget: float = DEFAULT_TIME_BUDGET, n_jobs: Optional[int] = None) -> Dict:
+    """План консолидации грузов по рейсам.
+
+    Грузы делятся на полосы по расстоянию, полосы упаковываются независимо
+    (параллельно в общем пуле процессов для больших планов). time_budget
+    ограничивает упаковку всего плана: полоса получает долю времени по числу
+    грузов, и ни одна полоса не решается дольше общего срока. Срок
+    отсчитывается после того, как пул готов. Стоимость рейса
+    считает trip_costs по выбранному транспорту, расход топлива - по правилу
+    выбранного транспорта и наибольшему расстоянию. Базой для экономии служит
+    отправка каждого груза отдельно транспортом, который рекомендуют правила.
+    """
+    if band_width <= 0:
+        raise ValueError("Ширина полосы расстояний должна быть положительной")
+    if stop_hours < 0 or max_delay < 0 or time_budget <= 0:
+        raise ValueError("Задержки должны быть неотрицательными, а время на решение - положительным")
+    start = time.perf_counter()
+
+    catalog = vehicle_catalog(rules)
+    capacity = max(v['capacity_kg'] for v in catalog)
+    features = cargo_matrix(cargo_list)
+    columns = matrix_columns(features)
+    if not np.isfinite(features).all() or (features < 0).any():
+        raise ValueError("Признаки грузов должны быть неотрицательными числами")
+    ids = [cargo.get('shipment_id', i) for i, cargo in enumerate(cargo_list)]
+
+    # Груз тяжелее любого транспорта в план не попадает
+    oversize = columns['weight'] > capacity
+    planned = np.flatnonzero(~oversize)
+    band_of = np.floor(columns['distance'][planned] / band_width).astype(np.int64)
+    bands = [planned[band_of == band] for band in np.unique(band_of).tolist()]
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(bands)) if len(planned) >= PARALLEL_MIN_SHIPMENTS else 1
+    executor = planner_pool(n_jobs) if n_jobs > 1 else None
+    deadline = time.time() + time_budget
+    # Доли времени полос: в n_jobs процессах одновременно решается n_jobs полос
+    tasks = [(columns['weight'][items], columns['delivery_time'][items], capacity, stop_hours, max_delay,
+              time_budget * n_jobs * len(items) / len(planned), deadline)
+             for items in bands]
+    if executor is not None:
+        try:
+            results = list(executor.map(solve_band, *zip(*tasks)))
+        except BrokenProcessPool:
+            # Упавший рабочий процесс ломает пул: следующий план запустит новый
+            _discard_pool(executor)
+            raise
+    else:
+        results = [solve_band(*task) for task in tasks]
+
+    trips = [items[bin_items] for items, (bins, _, _) in zip(bands, results) for bin_items in map(np.array, bins)]
+    weight = np.array([columns['weight'][t].sum() for t in trips])
+    distance = np.array([columns['distance'][t].max() for t in trips])
+    delivery_time = np.array([columns['delivery_time'][t].max() + stop_hours * (len(t) - 1) for t in trips])
+    # Для выбора транспорта по правилам: стоимость рейса без учета транспорта
+    max_cost = np.array([columns['cost'][t].max() for t in trips])
+    vehicles = choose_vehicles(rules, catalog, {
+        'weight': weight, 'distance': distance, 'delivery_time': delivery_time, 'cost': max_cost
+    })
+    vehicle_fuel = np.array([catalog[v]['fuel_l_per_100km'] for v in vehicles.tolist()])
+    fuel = vehicle_fuel * distance / 100
+
+    # База: каждый груз отдельно, транспортом из рекомендаций
+    own_fuel = np.array([float(rules.vehicles[r].get('fuel_l_per_100km', 0.0)) if r >= 0 else 0.0
+                         for r in rules.vehicle_choice(columns).tolist()])
+    baseline_fuel = own_fuel[planned] * columns['distance'][planned] / 100
+    cost = trip_costs(trips, vehicle_fuel, columns, own_fuel)
+    baseline_cost = float(columns['cost'][planned].sum())
+    total_cost = float(cost.sum())
+
+    plan = [{
+        'vehicle_type': catalog[v]['vehicle_type'],
+        'capacity_kg': catalog[v]['capacity_kg'],
+        'shipments': [ids[i] for i in items.tolist()],
+        'weight': w,
+        'utilization': w / catalog[v]['capacity_kg'],
+        'distance': d,
+        'delivery_time': t,
+        'cost': c,
+        'fuel_liters': f
+    } for items, v, w, d, t, c, f in zip(trips, vehicles.tolist(), weight.tolist(), distance.tolist(),
+                                         delivery_time.tolist(), cost.tolist(), fuel.tolist())]
+
+    return {
+        'trips': plan,
+        'unassigned': [{'shipment': ids[i], 'reason': "Вес превышает грузоподъемность транспорта"}
+                       for i in np.flatnonzero(oversize).tolist()],
+        'summary': {
+            'shipments': len(cargo_list),
+            'planned_shipments': int(len(planned)),
+            'trips': len(plan),
+            'total_cost': total_cost,
+            'baseline_cost': baseline_cost,
+            'savings': baseline_cost - total_cost,
+            'savings_percent': (baseline_cost - total_cost) / baseline_cost * 100 if baseline_cost else 0.0,
+            'fuel_liters': float(fuel.sum()),
+            'baseline_fuel_liters': float(baseline_fuel.sum()),
+            'mean_utilization': float(np.mean([trip['utilization'] for trip in plan])) if plan else 0.0,
+            'bands': len(bands),
+            'timed_out_bands': sum(timed_out for _, timed_out, _ in results),
+            'solve_s': float(sum(elapsed for _, _, elapsed in results)),
+            'n_jobs': n_jobs,
+            'elapsed_s': time.perf_counter() - start
+        }
+    }
@@ -0,0 +1,252 @@
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Границы корзин гистограмм задержки (секунды)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_labels(labelnames: Sequence[str], values: Tuple, *extra: str) -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(labelnames, values)]
+    parts.extend(label for label in extra if label)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def snapshot(self) -> List:
+        """Значения метрики в виде, пригодном для JSON: [[метки, значение], ...]"""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def render(self, workers: Optional[List[Tuple[str, List]]] = None) -> List[str]:
+        """Текст метрики по снимкам рабочих процессов [(worker, snapshot), ...]"""
+        if workers is None:
+            workers = [(str(os.getpid()), self.snapshot())]
+        lines = self.header()
+        for worker, items in workers:
+            for key, value in items:
+                lines.extend(self._sample_lines(tuple(key), value, f'worker="{_escape(worker)}"'))
+        return lines
+
+    def _sample_lines(self, key: Tuple, value, worker: str) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key, worker)} {_format_value(value)}"]
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+class Gauge(_Metric):
+    """Значение, которое может как расти, так и уменьшаться"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Для каждого набора меток: счетчики по корзинам (последняя - +Inf), сумма
+        self._values: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Замер длительности блока кода"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> List:
+        with self._lock:
+            return [[list(key), [list(state[0]), state[1]]] for key, state in self._values.items()]
+
+    def _sample_lines(self, key: Tuple, value, worker: str) -> List[str]:
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, worker, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key, worker)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, key, worker)} {cumulative}")
+        return lines
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Registry:
+    """Набор метрик, выводимых в текстовом формате Prometheus.
+
+    У каждого рабочего процесса API свой набор значений. Чтобы /metrics
+    показывал все процессы, а не тот, что принял запрос, процессы
+    периодически записывают снимки в общий каталог (dump), а render
+    объединяет их; у каждого значения есть метка worker с PID процесса.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self) -> Dict[str, List]:
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def dump(self, directory: str):
+        """Запись снимка метрик этого процесса в {directory}/{pid}.json с атомарной заменой"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex[:6]}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def discard(self, directory: str):
+        """Удаление снимка этого процесса при остановке"""
+        try:
+            os.remove(os.path.join(directory, f"{os.getpid()}.json"))
+        except FileNotFoundError:
+            pass
+
+    def _read_snapshots(self, directory: str) -> Dict[str, Dict]:
+        """Снимки других живых процессов; снимки завершившихся процессов удаляются"""
+        snapshots = {}
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return snapshots
+        for name in names:
+            pid, ext = os.path.splitext(name)
+            if ext != '.json' or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            path = os.path.join(directory, name)
+            if not _process_alive(int(pid)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            try:
+                with open(path, encoding='utf-8') as f:
+                    snapshots[pid] = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+        return snapshots
+
+    def render(self, directory: Optional[str] = None) -> str:
+        """Метрики этого процесса и, если задан directory, остальных рабочих процессов"""
+        workers = {str(os.getpid()): self.snapshot()}
+        if directory is not None:
+            workers.update(self._read_snapshots(directory))
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render([(worker, snapshot.get(metric.name, []))
+                                        for worker, snapshot in sorted(workers.items())]))
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'cargo_http_request_duration_seconds', 'Длительность обработки HTTP-запроса', ('method', 'path')
+))
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    'cargo_http_requests_total', 'Число HTTP-запросов', ('method', 'path', 'status')
+))
+HTTP_ERRORS = REGISTRY.register(Counter(
+    'cargo_http_errors_total', 'Число HTTP-запросов, завершившихся ошибкой сервера', ('method', 'path')
+))
+ROUTE_STAGE_SECONDS = REGISTRY.register(Histogram(
+    'cargo_route_stage_duration_seconds', 'Длительность этапов подбора маршрутов', ('stage',)
+))
+TRAINING_STAGE_SECONDS = REGISTRY.register(Histogram(
+    'cargo_training_stage_duration_seconds', 'Длительность этапов обучения', ('stage',)
+))
+CLUSTER_SIZE = REGISTRY.register(Gauge(
+    'cargo_cluster_size', 'Число маршрутов в кластере', ('cluster',)
+))
+MODEL_INFO = REGISTRY.register(Gauge(
+    'cargo_model_info', 'Текущая версия модели', ('model_version',)
+))
+MODEL_SAMPLES = REGISTRY.register(Gauge(
+    'cargo_model_samples', 'Число маршрутов, известных модели'
+))
+
+def update_model_gauges(system):
+    """Обновление показателей модели непосредственно перед выдачей метрик"""
+    MODEL_INFO.clear()
+    CLUSTER_SIZE.clear()
+    if system.model is None:
+        MODEL_SAMPLES.set(0)
+        return
+    MODEL_INFO.set(1, model_version=system.model_version or '')
+    MODEL_SAMPLES.set(system.n_samples)
+    if system.cluster_counts is not None:
+        for cluster, size in enumerate(system.cluster_counts.tolist()):
+            CLUSTER_SIZE.set(size, cluster=cluster)
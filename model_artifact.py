@@ -0,0 +1,219 @@
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Без fcntl (Windows) журнал добавлений не защищен от параллельной записи
+    fcntl = None
+
+import numpy as np
+
+from route_index import RouteIndex
+
+# Версия формата артефакта; увеличивается при несовместимых изменениях структуры
+FORMAT_VERSION = 1
+
+MANIFEST_FILE = 'manifest.json'
+MODEL_FILE = 'model.joblib'
+ROUTES_DIR = 'routes'
+# Параметры модели в виде массивов NumPy для вывода без scikit-learn
+ARRAYS_DIR = 'arrays'
+LATEST_FILE = 'LATEST'
+VERSIONS_DIR = 'versions'
+# Именованные ссылки на версии (сегменты, регионы, варианты A/B-теста)
+ALIASES_FILE = 'aliases.json'
+# Имя, которое всегда указывает на последнюю опубликованную версию
+LATEST_ALIAS = 'latest'
+
+# Журнал маршрутов, добавленных через ingest после публикации версии
+INGEST_LOG = 'ingest.ndjson'
+INGEST_LOCK = 'ingest.lock'
+
+# Сколько последних версий хранится на диске
+KEEP_VERSIONS = 5
+
+def new_version() -> str:
+    """Идентификатор новой версии модели"""
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+def version_path(root: str, version: str) -> str:
+    return os.path.join(root, VERSIONS_DIR, version)
+
+def latest_version(root: str) -> Optional[str]:
+    """Последняя опубликованная версия или None, если артефакта нет"""
+    try:
+        with open(os.path.join(root, LATEST_FILE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def list_versions(root: str) -> List[str]:
+    """Опубликованные версии в порядке создания"""
+    directory = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        name for name in os.listdir(directory)
+        if os.path.exists(os.path.join(directory, name, MANIFEST_FILE))
+    )
+
+def version_exists(root: str, version: str) -> bool:
+    # Имя версии не должно выводить за пределы каталога версий
+    if not version or version != os.path.basename(version) or version.startswith('.'):
+        return False
+    return os.path.exists(os.path.join(version_path(root, version), MANIFEST_FILE))
+
+def read_aliases(root: str) -> Dict[str, str]:
+    """Именованные ссылки на версии"""
+    try:
+        with open(os.path.join(root, ALIASES_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _write_aliases(root: str, aliases: Dict[str, str]):
+    tmp_path = os.path.join(root, f"{ALIASES_FILE}.tmp-{uuid.uuid4().hex[:6]}")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(aliases, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(root, ALIASES_FILE))
+
+def set_alias(root: str, alias: str, version: str):
+    """Назначение имени версии; версия с именем не удаляется при очистке старых"""
+    if alias == LATEST_ALIAS:
+        raise ValueError(f"Имя {LATEST_ALIAS} зарезервировано за последней опубликованной версией")
+    if not version_exists(root, version):
+        raise ValueError(f"Версия модели не найдена: {version}")
+    aliases = read_aliases(root)
+    aliases[alias] = version
+    _write_aliases(root, aliases)
+
+def remove_alias(root: str, alias: str) -> bool:
+    aliases = read_aliases(root)
+    if aliases.pop(alias, None) is None:
+        return False
+    _write_aliases(root, aliases)
+    return True
+
+def resolve_version(root: str, name: Optional[str] = None) -> Optional[str]:
+    """Версия по имени: ссылке, 'latest' или самому идентификатору версии (None, если не найдена)"""
+    if not name or name == LATEST_ALIAS:
+        return latest_version(root)
+    version = read_aliases(root).get(name, name)
+    return version if version_exists(root, version) else None
+
+def read_manifest(root: str, version: Optional[str] = None) -> Dict:
+    """Описание версии артефакта"""
+    version = version or latest_version(root)
+    if version is None:
+        raise FileNotFoundError(f"Артефакт модели не найден: {root}")
+    with open(os.path.join(version_path(root, version), MANIFEST_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+@contextmanager
+def ingest_lock(root: str, version: str):
+    """Исключительная блокировка журнала добавлений версии (между процессами и потоками)"""
+    with open(os.path.join(version_path(root, version), INGEST_LOCK), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def append_ingest(root: str, version: str, routes: List[Dict]) -> int:
+    """Запись пакета маршрутов в журнал добавлений версии; возвращает длину журнала"""
+    with open(os.path.join(version_path(root, version), INGEST_LOG), 'ab') as f:
+        f.write((json.dumps(routes, ensure_ascii=False) + '\n').encode('utf-8'))
+        return f.tell()
+
+def read_ingest(root: str, version: str, offset: int = 0) -> Tuple[List[List[Dict]], int]:
+    """Пакеты журнала добавлений, записанные после offset, и новое смещение"""
+    try:
+        with open(os.path.join(version_path(root, version), INGEST_LOG), 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], offset
+    # Читаются только полностью записанные строки
+    end = data.rfind(b'\n') + 1
+    return [json.loads(line) for line in data[:end].splitlines() if line], offset + end
+
+def save_artifact(root: str, model_data: Dict, route_index: Optional[RouteIndex],
+                  metadata: Optional[Dict] = None, keep: int = KEEP_VERSIONS,
+                  arrays: Optional[Dict[str, np.ndarray]] = None, publish: bool = True) -> str:
+    """Сохранение новой версии артефакта и ее публикация.
+
+    Версия собирается во временном каталоге и становится видимой после
+    атомарной замены файла LATEST, поэтому читатели никогда не видят
+    частично записанный артефакт. При publish=False файл LATEST не меняется:
+    версия доступна только по идентификатору или по назначенному имени.
+    """
+    version = new_version()
+    final_path = version_path(root, version)
+    tmp_path = os.path.join(root, VERSIONS_DIR, f".tmp-{version}")
+    os.makedirs(tmp_path)
+
+    import joblib
+    joblib.dump(model_data, os.path.join(tmp_path, MODEL_FILE))
+    if arrays:
+        os.makedirs(os.path.join(tmp_path, ARRAYS_DIR))
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, ARRAYS_DIR, f"{name}.npy"), array)
+    if route_index is not None:
+        route_index.save(os.path.join(tmp_path, ROUTES_DIR))
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'model_version': version,
+        'created_at': datetime.now().isoformat(),
+        'n_samples': len(route_index) if route_index is not None else 0,
+        **(metadata or {})
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    os.rename(tmp_path, final_path)
+    if publish:
+        with open(os.path.join(root, f"{LATEST_FILE}.tmp"), 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(os.path.join(root, f"{LATEST_FILE}.tmp"), os.path.join(root, LATEST_FILE))
+
+    # Старые версии удаляются, кроме опубликованной и версий с именами;
+    # отображенные в память файлы остаются доступны открывшим их процессам
+    protected = set(read_aliases(root).values()) | {latest_version(root), version}
+    for old in list_versions(root)[:-keep] if keep else []:
+        if old not in protected:
+            shutil.rmtree(version_path(root, old), ignore_errors=True)
+    return version
+
+def load_artifact(root: str, version: Optional[str] = None, mmap: bool = True, inference_only: bool = False):
+    """Загрузка версии артефакта: (манифест, данные модели, индекс маршрутов).
+
+    При inference_only и наличии массивов модели данные модели - это
+    {'arrays': {...}}: объекты scikit-learn не распаковываются, и сама
+    библиотека не импортируется.
+    """
+    manifest = read_manifest(root, version)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Неподдерживаемая версия формата артефакта: {manifest.get('format_version')}")
+
+    path = version_path(root, manifest['model_version'])
+    arrays_path = os.path.join(path, ARRAYS_DIR)
+    if inference_only and os.path.isdir(arrays_path):
+        model_data = {'arrays': {
+            name[:-len('.npy')]: np.load(os.path.join(arrays_path, name))
+            for name in os.listdir(arrays_path) if name.endswith('.npy')
+        }}
+    else:
+        import joblib
+        model_data = joblib.load(os.path.join(path, MODEL_FILE))
+    routes_path = os.path.join(path, ROUTES_DIR)
+    route_index = RouteIndex.open(routes_path, mmap=mmap) if os.path.isdir(routes_path) else None
+    return manifest, model_data, route_index
@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import model_artifact
+
+class ModelRegistry:
+    """Версии моделей из артефакта, загружаемые по запросу.
+
+    Загруженные системы хранятся в LRU-кеше. Когда их суммарный объем
+    (CargoRecommendationSystem.memory_bytes) превышает memory_budget,
+    вытесняются давно не использовавшиеся версии; последняя загруженная
+    остается, даже если одна не помещается в бюджет. Каждая версия
+    загружается не более одного раза, даже при одновременных запросах.
+    """
+
+    def __init__(self, root: str, memory_budget: int = 512 * 2 ** 20, inference_only: bool = False):
+        self.root = root
+        self.memory_budget = memory_budget
+        self.inference_only = inference_only
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self._models = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, name: Optional[str]) -> str:
+        """Идентификатор версии по имени, ссылке или 'latest'"""
+        version = model_artifact.resolve_version(self.root, name)
+        if version is None:
+            raise KeyError(name)
+        return version
+
+    def get(self, name: Optional[str]):
+        """Система рекомендаций для версии; загружается при первом обращении"""
+        version = self.resolve(name)
+        with self._lock:
+            entry = self._models.get(version)
+            if entry is not None:
+                self._models.move_to_end(version)
+                self.hits += 1
+                return entry[0]
+            loading = self._loading.setdefault(version, threading.Lock())
+
+        # Загрузка идет вне общей блокировки, чтобы не задерживать запросы к другим версиям
+        with loading:
+            with self._lock:
+                entry = self._models.get(version)
+                if entry is not None:
+                    self._models.move_to_end(version)
+                    self.hits += 1
+                    return entry[0]
+
+            from recommendation_system import CargoRecommendationSystem
+            system = CargoRecommendationSystem()
+            system.load_model(self.root, version=version, inference_only=self.inference_only)
+
+            with self._lock:
+                self._models[version] = (system, system.memory_bytes())
+                self._loading.pop(version, None)
+                self.loads += 1
+                self._evict()
+        return system
+
+    def _evict(self):
+        while len(self._models) > 1 and sum(size for _, size in self._models.values()) > self.memory_budget:
+            self._models.popitem(last=False)
+            self.evictions += 1
+
+    def loaded(self) -> List:
+        """Загруженные системы, от давно использованной к недавней"""
+        with self._lock:
+            return [system for system, _ in self._models.values()]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'loaded': [{'model_version': version, 'memory_bytes': size} for version, (_, size) in self._models.items()],
+                'memory_bytes': sum(size for _, size in self._models.values()),
+                'memory_budget': self.memory_budget,
+                'hits': self.hits,
+                'loads': self.loads,
+                'evictions': self.evictions
+            }
@@ -1,178 +1,683 @@
-import pandas as pd
-import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Optional
-import json
-import joblib
-from datetime import datetime
-from visualization import CargoVisualizer
-
-class CargoRecommendationSystem:
-    def __init__(self):
-        self.data = None
-        self.scaler = StandardScaler()
-        self.model = None
-        self.visualizer = CargoVisualizer()
-        
-    def load_data(self, file_path: str):
-        """Загрузка данных о грузоперевозках"""
-        self.data = pd.read_csv(file_path)
-        
-    def preprocess_data(self):
-        """Предобработка данных"""
-        if self.data is None:
-            raise ValueError("Данные не загружены")
-            
-        # Выбираем числовые признаки для кластеризации
-        features = ['weight', 'distance', 'delivery_time', 'cost']
-        X = self.data[features].copy()
-        
-        # Масштабирование данных
-        X_scaled = self.scaler.fit_transform(X)
-        return X_scaled
-        
-    def train_model(self, n_clusters: int = 5):
-        """Обучение модели кластеризации"""
-        X_scaled = self.preprocess_data()
-        self.model = KMeans(n_clusters=n_clusters, random_state=42)
-        self.data['cluster'] = self.model.fit_predict(X_scaled)
-        
-        # Генерация визуализаций
-        self.visualizer.generate_report(self.data, self.data['cluster'])
-        
-    def save_model(self, path: str = "cargo_model"):
-        """Сохранение модели и скейлера"""
-        if self.model is None:
-            raise ValueError("Модель не обучена")
-            
-        model_data = {
-            'model': self.model,
-            'scaler': self.scaler,
-            'timestamp': datetime.now().isoformat()
-        }
-        joblib.dump(model_data, f"{path}.joblib")
-        
-    def load_model(self, path: str = "cargo_model"):
-        """Загрузка сохраненной модели"""
-        model_data = joblib.load(f"{path}.joblib")
-        self.model = model_data['model']
-        self.scaler = model_data['scaler']
-        
-    def get_route_recommendations(self, cargo_data: Dict) -> List[Dict]:
-        """Получение рекомендаций по маршрутам"""
-        if self.model is None:
-            raise ValueError("Модель не обучена")
-            
-        # Преобразование входных данных
-        input_features = np.array([[
-            cargo_data['weight'],
-            cargo_data['distance'],
-            cargo_data['delivery_time'],
-            cargo_data['cost']
-        ]])
-        
-        # Масштабирование входных данных
-        input_scaled = self.scaler.transform(input_features)
-        
-        # Определение кластера для нового груза
-        cluster = self.model.predict(input_scaled)[0]
-        
-        # Поиск похожих маршрутов в том же кластере
-        similar_routes = self.data[self.data['cluster'] == cluster]
-        
-        # Сортировка по схожести
-        recommendations = []
-        for _, route in similar_routes.iterrows():
-            recommendations.append({
-                'route_id': route['route_id'],
-                'similarity_score': float(route['success_rate']),
-                'estimated_time': float(route['delivery_time']),
-                'estimated_cost': float(route['cost']),
-                'cluster': int(route['cluster'])
-            })
-            
-        return sorted(recommendations, key=lambda x: x['similarity_score'], reverse=True)[:5]
-        
-    def get_vehicle_recommendations(self, cargo_data: Dict) -> List[Dict]:
-        """Рекомендации по выбору транспорта"""
-        recommendations = []
-        
-        # Простая логика выбора транспорта на основе веса и расстояния
-        weight = cargo_data['weight']
-        distance = cargo_data['distance']
-        
-        if weight < 1000 and distance < 100:
-            recommendations.append({
-                'vehicle_type': 'small_truck',
-                'capacity': 'до 1 тонны',
-                'suitable_for': 'короткие городские перевозки',
-                'estimated_fuel_consumption': '10-12 л/100км',
-                'advantages': ['Экономичность', 'Маневренность', 'Простота парковки']
-            })
-        elif weight < 5000 and distance < 500:
-            recommendations.append({
-                'vehicle_type': 'medium_truck',
-                'capacity': 'до 5 тонн',
-                'suitable_for': 'региональные перевозки',
-                'estimated_fuel_consumption': '15-18 л/100км',
-                'advantages': ['Оптимальное соотношение грузоподъемности и расхода топлива', 'Универсальность']
-            })
-        else:
-            recommendations.append({
-                'vehicle_type': 'large_truck',
-                'capacity': 'более 5 тонн',
-                'suitable_for': 'межрегиональные перевозки',
-                'estimated_fuel_consumption': '25-30 л/100км',
-                'advantages': ['Высокая грузоподъемность', 'Комфорт для водителя', 'Экономичность при больших объемах']
-            })
-            
-        return recommendations
-        
-    def get_cost_optimization(self, cargo_data: Dict) -> Dict:
-        """Рекомендации по оптимизации стоимости"""
-        recommendations = {
-            'current_cost': cargo_data['cost'],
-            'optimization_suggestions': [],
-            'potential_savings': 0
-        }
-        
-        # Анализ и рекомендации по оптимизации
-        if cargo_data['distance'] > 500:
-            recommendations['optimization_suggestions'].append({
-                'suggestion': 'Рассмотрите возможность использования железнодорожного транспорта',
-                'potential_savings_percent': 20,
-                'reason': 'Для больших расстояний железнодорожный транспорт может быть более экономичным'
-            })
-            
-        if cargo_data['delivery_time'] > 24:
-            recommendations['optimization_suggestions'].append({
-                'suggestion': 'Оптимизация маршрута может сократить время доставки',
-                'potential_savings_percent': 15,
-                'reason': 'Сокращение времени в пути снижает расходы на топливо и обслуживание'
-            })
-            
-        # Расчет потенциальной экономии
-        total_savings_percent = sum(s['potential_savings_percent'] for s in recommendations['optimization_suggestions'])
-        recommendations['potential_savings'] = cargo_data['cost'] * (total_savings_percent / 100)
-        
-        return recommendations
-        
-    def get_weather_recommendations(self, cargo_data: Dict) -> Dict:
-        """Рекомендации с учетом погодных условий"""
-        recommendations = {
-            'weather_considerations': [],
-            'safety_recommendations': []
-        }
-        
-        # Примеры рекомендаций (в реальной системе здесь был бы API погоды)
-        if cargo_data['distance'] > 300:
-            recommendations['weather_considerations'].append(
-                'Рекомендуется проверить прогноз погоды на маршруте'
-            )
-            recommendations['safety_recommendations'].append(
-                'Убедитесь, что транспортное средство оборудовано для работы в различных погодных условиях'
-            )
-            
-        return recommendations 
\ No newline at end of file
+import numpy as np
+from typing import List, Dict, Optional, Tuple, Union, TYPE_CHECKING
+import copy
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from route_index import RouteIndex, StoreWriter, FEATURES
+from rules import RuleEngine, cargo_columns, cargo_matrix, matrix_columns
+from inference import ArrayScaler, export_arrays, from_arrays
+import load_planner
+import model_artifact
+import metrics
+
+# pandas, scikit-learn и графические библиотеки импортируются только там, где
+# они нужны (обучение, отчеты, дообучение), чтобы процесс, который только
+# выдает рекомендации, запускался быстрее и занимал меньше памяти
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Разделы сводной рекомендации (recommend_all)
+RECOMMENDATION_SECTIONS = ('routes', 'vehicles', 'cost_optimization', 'weather')
+
+# Компактные типы столбцов для потокового чтения больших CSV
+CARGO_DTYPES = {
+    'route_id': np.int32,
+    'weight': np.float32,
+    'distance': np.float32,
+    'delivery_time': np.float32,
+    'cost': np.float32,
+    'success_rate': np.float32
+}
+
+def _append_csv(path: str, frame: 'pd.DataFrame'):
+    """Дозапись строк в CSV без чтения всего файла (новый файл создается с заголовком)"""
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        frame.to_csv(path, index=False)
+        return
+    with open(path, 'rb+') as f:
+        f.seek(0, 2)
+        if f.tell() > 0:
+            f.seek(-1, 2)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+    frame.to_csv(path, mode='a', header=False, index=False)
+
+def _data_files(file_path: Union[str, List[str]]) -> List[str]:
+    return [file_path] if isinstance(file_path, str) else list(file_path)
+
+class CargoRecommendationSystem:
+    def __init__(self):
+        self._data = None
+        self.scaler = None
+        self.model = None
+        self.route_index = None
+        self.model_version = None
+        # Меняется при любом изменении модели или маршрутов; по нему сбрасываются кеши
+        self.revision = uuid.uuid4().hex
+        self.cluster_counts = None
+        # Результат автоматического выбора числа кластеров (None, если число задано явно)
+        self.k_selection = None
+        # Ключ отчета: вычисляется при обучении и хранится в манифесте артефакта
+        self._report_key = None
+        self._ingested = []
+        # Часть журнала добавлений опубликованной версии, уже примененная к модели (байт)
+        self._ingest_offset = 0
+        self._ingest_lock = threading.Lock()
+        # Скейлер, модель и индекс маршрутов подменяются при дообучении вместе под этой блокировкой
+        self._state_lock = threading.Lock()
+        self.rules = RuleEngine.load()
+        # Длительность последнего выполнения этапов обучения (load, select_k, fit, plot, dump)
+        self.stage_timings = {}
+        self._visualizer = None
+        
+    @property
+    def visualizer(self):
+        """Построитель графиков; создается при первом отчете"""
+        if self._visualizer is None:
+            from visualization import CargoVisualizer
+            self._visualizer = CargoVisualizer()
+        return self._visualizer
+        
+    @property
+    def inference_only(self) -> bool:
+        """Модель загружена из массивов артефакта и пригодна только для выдачи рекомендаций"""
+        return isinstance(self.scaler, ArrayScaler)
+        
+    @property
+    def data(self):
+        """Таблица маршрутов.
+
+        Если система загружена из хранилища маршрутов, таблица строится из
+        него только при первом обращении (для отчетов и переобучения),
+        а рекомендации работают напрямую с отображенными в память массивами.
+        """
+        if self._data is None and self.route_index is not None:
+            self._data = self.route_index.to_frame()
+            # Добавленные маршруты уже содержатся в индексе
+            self._ingested = []
+        return self._data
+        
+    @data.setter
+    def data(self, value):
+        self._data = value
+        
+    def _record_stage(self, stage: str, start: float):
+        elapsed = time.perf_counter() - start
+        self.stage_timings[stage] = elapsed
+        metrics.TRAINING_STAGE_SECONDS.observe(elapsed, stage=stage)
+        
+    def load_data(self, file_path: Union[str, List[str]]):
+        """Загрузка данных о грузоперевозках из одного или нескольких CSV"""
+        import pandas as pd
+        start = time.perf_counter()
+        frames = [pd.read_csv(path) for path in _data_files(file_path)]
+        self.data = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        self._record_stage('load', start)
+        
+    def preprocess_data(self):
+        """Предобработка данных"""
+        if self.data is None:
+            raise ValueError("Данные не загружены")
+            
+        # Выбираем числовые признаки для кластеризации
+        X = self.data[FEATURES].copy()
+        
+        # Масштабирование данных
+        from sklearn.preprocessing import StandardScaler
+        self.scaler = StandardScaler()
+        X_scaled = self.scaler.fit_transform(X)
+        return X_scaled
+        
+    def _resolve_n_clusters(self, n_clusters: Union[int, str], X_scaled) -> int:
+        """Число кластеров; при n_clusters='auto' подбирается по подвыборке"""
+        if n_clusters != 'auto':
+            self.k_selection = None
+            return int(n_clusters)
+        from cluster_selection import select_n_clusters
+        start = time.perf_counter()
+        self.k_selection = select_n_clusters(X_scaled)
+        self._record_stage('select_k', start)
+        return self.k_selection['best_k']
+        
+    def train_model(self, n_clusters: Union[int, str] = 5):
+        """Обучение модели кластеризации (n_clusters='auto' - с подбором числа кластеров)"""
+        from sklearn.cluster import KMeans
+        X_scaled = self.preprocess_data()
+        n_clusters = self._resolve_n_clusters(n_clusters, X_scaled)
+        start = time.perf_counter()
+        self.model = KMeans(n_clusters=n_clusters, random_state=42)
+        self.data['cluster'] = self.model.fit_predict(X_scaled)
+        self.build_route_index()
+        self._record_stage('fit', start)
+        
+    def train_model_streaming(self, file_path: Union[str, List[str]], n_clusters: Union[int, str] = 5, chunksize: int = 100_000):
+        """Потоковое обучение модели на CSV (одном или нескольких), не помещающихся в память.
+
+        Файл читается частями в четыре прохода: статистика скейлера,
+        MiniBatchKMeans.partial_fit, распределение строк по кластерам и
+        запись строк индекса прямо в файлы .npy на их итоговые места.
+        Признаки целиком в память не загружаются, индекс отображается в память
+        из файлов. Но память все равно O(n): ключи сортировки (кластер,
+        успешность, порядок и позиции строк) занимают около 30 байт на строку,
+        а build_cells - около 27 байт на строку.
+        """
+        import pandas as pd
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.cluster import MiniBatchKMeans
+        from cluster_selection import DEFAULT_SAMPLE_SIZE
+        
+        def read_chunks():
+            for path in _data_files(file_path):
+                yield from pd.read_csv(path, usecols=list(CARGO_DTYPES), dtype=CARGO_DTYPES, chunksize=chunksize)
+            
+        def chunk_features(chunk):
+            # Признаки приводятся к float64 только в пределах одной части
+            return chunk[FEATURES].to_numpy(dtype=np.float64)
+            
+        start = time.perf_counter()
+        
+        # Проход 1: инкрементальная статистика для масштабирования
+        self.scaler = StandardScaler()
+        for chunk in read_chunks():
+            self.scaler.partial_fit(chunk_features(chunk))
+        n_rows = int(self.scaler.n_samples_seen_)
+        
+        if n_clusters == 'auto':
+            # Дополнительный проход: равномерная подвыборка для подбора числа кластеров
+            rng = np.random.default_rng(42)
+            fraction = min(1.0, 2 * DEFAULT_SAMPLE_SIZE / max(n_rows, 1))
+            sample = [X[rng.random(len(X)) < fraction]
+                      for X in (self.scaler.transform(chunk_features(chunk)) for chunk in read_chunks())]
+            n_clusters = self._resolve_n_clusters(n_clusters, np.concatenate(sample))
+        else:
+            n_clusters = self._resolve_n_clusters(n_clusters, None)
+        
+        # Проход 2: обучение кластеризации по частям
+        self.model = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3)
+        for chunk in read_chunks():
+            if len(chunk) >= n_clusters:
+                self.model.partial_fit(self.scaler.transform(chunk_features(chunk)))
+        if not hasattr(self.model, 'cluster_centers_'):
+            raise ValueError("Недостаточно данных для обучения")
+            
+        # Проход 3: кластеры и успешность всех строк - ключи порядка индекса
+        clusters = np.empty(n_rows, dtype=np.int16)
+        success = np.empty(n_rows, dtype=np.float32)
+        offset = 0
+        for chunk in read_chunks():
+            stop = offset + len(chunk)
+            clusters[offset:stop] = self.model.predict(self.scaler.transform(chunk_features(chunk)))
+            success[offset:stop] = chunk['success_rate'].to_numpy()
+            offset = stop
+        order = np.lexsort((-success, clusters))
+        offsets = np.searchsorted(clusters[order], np.arange(n_clusters + 1))
+        positions = np.empty(n_rows, dtype=np.int64)
+        positions[order] = np.arange(n_rows)
+        del order, success
+        
+        # Проход 4: строки записываются сразу на свои места в файлах индекса
+        directory = tempfile.mkdtemp(prefix='cargo-routes-')
+        try:
+            writer = StoreWriter(directory, n_rows, n_clusters)
+            offset = 0
+            for chunk in read_chunks():
+                stop = offset + len(chunk)
+                writer.write(positions[offset:stop], chunk['route_id'].to_numpy(), chunk_features(chunk),
+                             chunk['success_rate'].to_numpy(), clusters[offset:stop])
+                offset = stop
+            writer.close(offsets)
+            del positions, clusters
+            self._set_route_index(RouteIndex.open(directory, mmap=True))
+        finally:
+            # Отображенные файлы остаются доступны и после удаления каталога
+            shutil.rmtree(directory, ignore_errors=True)
+        self.route_index.build_cells(self.scaler.scale_)
+        self._report_key = self.route_index.fingerprint()
+        # При потоковом обучении чтение данных входит в этап обучения
+        self._record_stage('fit', start)
+        
+    def generate_report(self, force: bool = False) -> bool:
+        """Генерация отчета с визуализациями (кешируется по данным и кластерам)"""
+        if self.route_index is None:
+            raise ValueError("Модель не обучена")
+        from visualization import cached_report_key
+        key = self.report_key
+        # Если отчет уже построен для этих маршрутов, таблица данных даже не собирается
+        if not force and cached_report_key() == key:
+            return False
+        self._consolidate_data()
+        start = time.perf_counter()
+        generated = self.visualizer.generate_report(self.data, self.data['cluster'], force=force, key=key)
+        if generated:
+            self._record_stage('plot', start)
+        return generated
+        
+    @property
+    def report_key(self) -> str:
+        """Ключ отчета для текущих маршрутов и кластеров.
+
+        Вычисляется по индексу маршрутов при обучении и сохраняется в манифесте,
+        поэтому после перезапуска или горячей перезагрузки той же версии
+        данные заново не хешируются. Сбрасывается при изменении маршрутов.
+        """
+        if self._report_key is None:
+            if self.route_index is None:
+                raise ValueError("Индекс маршрутов не построен")
+            self._report_key = self.route_index.fingerprint()
+        return self._report_key
+        
+    def save_model(self, path: str = "cargo_model", publish: bool = True) -> str:
+        """Сохранение версии артефакта: модель, скейлер, таблица маршрутов и индекс.
+
+        При publish=False версия не становится последней опубликованной
+        (см. model_artifact.save_artifact) и загружается только явно.
+        """
+        if self.model is None:
+            raise ValueError("Модель не обучена")
+            
+        start = time.perf_counter()
+        model_data = {
+            'model': self.model,
+            'scaler': self.scaler,
+            'timestamp': datetime.now().isoformat()
+        }
+        self.model_version = model_artifact.save_artifact(
+            path, model_data, self.route_index,
+            metadata={'n_clusters': int(self.model.n_clusters), 'features': FEATURES, 'k_selection': self.k_selection,
+                      'report_key': self.report_key if self.route_index is not None else None},
+            arrays=export_arrays(self.scaler, self.model), publish=publish
+        )
+        self._record_stage('dump', start)
+        return self.model_version
+        
+    def load_model(self, path: str = "cargo_model", version: Optional[str] = None, mmap: bool = True,
+                   inference_only: bool = False):
+        """Загрузка сохраненной модели.
+
+        Версионированный артефакт содержит таблицу маршрутов и индекс, поэтому
+        после загрузки система сразу готова к работе. Для старого формата
+        ({path}.joblib) маршруты берутся из загруженных ранее данных.
+        При inference_only скейлер и центры кластеров берутся из массивов
+        артефакта без scikit-learn; дообучение (ingest) такой модели недоступно.
+        """
+        if model_artifact.latest_version(path) is not None:
+            manifest, model_data, route_index = model_artifact.load_artifact(
+                path, version, mmap=mmap, inference_only=inference_only
+            )
+            if 'arrays' in model_data:
+                self.scaler, self.model = from_arrays(model_data['arrays'])
+            else:
+                self.model = model_data['model']
+                self.scaler = model_data['scaler']
+            self.model_version = manifest['model_version']
+            self.k_selection = manifest.get('k_selection')
+            if route_index is not None:
+                self._set_route_index(route_index)
+                self._report_key = manifest.get('report_key')
+            # Маршруты, добавленные в эту версию после публикации
+            self._ingest_offset = 0
+            self.replay_ingest_log(path)
+            return
+            
+        import joblib
+        model_data = joblib.load(f"{path}.joblib")
+        self.model = model_data['model']
+        self.scaler = model_data['scaler']
+        self.model_version = model_data.get('timestamp')
+        self.k_selection = None
+        self.revision = uuid.uuid4().hex
+        
+        # Если данные уже загружены, распределяем их по кластерам загруженной модели
+        if self._data is not None:
+            X_scaled = self.scaler.transform(self.data[FEATURES])
+            self.data['cluster'] = self.model.predict(X_scaled)
+            self.build_route_index()
+        elif os.path.isdir(f"{path}_routes"):
+            self.load_route_store(f"{path}_routes")
+            
+    def save_route_store(self, directory: str):
+        """Сохранение таблицы маршрутов в компактное столбцовое хранилище"""
+        if self.route_index is None:
+            raise ValueError("Индекс маршрутов не построен")
+        self.route_index.save(directory)
+        
+    def load_route_store(self, directory: str, mmap: bool = True):
+        """Загрузка таблицы маршрутов из хранилища с отображением файлов в память"""
+        self._set_route_index(RouteIndex.open(directory, mmap=mmap))
+        
+    def _set_route_index(self, route_index: RouteIndex):
+        if self.model is not None:
+            route_index.ensure_n_clusters(self.model.n_clusters)
+        self.route_index = route_index
+        self.cluster_counts = np.diff(route_index.offsets)
+        self.revision = uuid.uuid4().hex
+        self._report_key = None
+        self._data = None
+        self._ingested = []
+        
+    def build_route_index(self):
+        """Построение индекса маршрутов по кластерам"""
+        if self.data is None or 'cluster' not in self.data:
+            raise ValueError("Данные не распределены по кластерам")
+        # Число кластеров берется из модели: последние кластеры могут оказаться пустыми
+        n_clusters = self.model.n_clusters if self.model is not None else None
+        self.route_index = RouteIndex.build(self.data, self.data['cluster'].to_numpy(), n_clusters=n_clusters)
+        # Ячейки внутри кластеров для поиска ближайших маршрутов
+        self.route_index.build_cells(self.scaler.scale_)
+        self.cluster_counts = np.diff(self.route_index.offsets)
+        self.revision = uuid.uuid4().hex
+        self._report_key = self.route_index.fingerprint()
+        self._ingested = []
+        
+    def memory_bytes(self) -> int:
+        """Оценка памяти, занимаемой моделью, индексом маршрутов и таблицей данных (байт)"""
+        total = self.route_index.nbytes if self.route_index is not None else 0
+        if self.model is not None:
+            total += self.model.cluster_centers_.nbytes
+        if self._data is not None:
+            total += int(self._data.memory_usage(index=True).sum())
+        return total
+        
+    @property
+    def n_samples(self) -> int:
+        """Число маршрутов, известных системе"""
+        if self.route_index is not None:
+            return len(self.route_index)
+        return len(self._data) if self._data is not None else 0
+        
+    def _consolidate_data(self):
+        """Присоединение добавленных через ingest маршрутов к таблице данных"""
+        if self._ingested:
+            import pandas as pd
+            self.data = pd.concat([self.data] + self._ingested, ignore_index=True)
+            self._ingested = []
+            
+    def _serving(self) -> tuple:
+        """Согласованные скейлер, модель и индекс маршрутов для обработки запроса"""
+        with self._state_lock:
+            return self.scaler, self.model, self.route_index
+
+    def ingest_routes(self, routes: List[Dict], data_path: Optional[str] = None) -> Dict:
+        """Инкрементальное добавление завершенных перевозок.
+
+        Скейлер и центры кластеров обновляются по новым маршрутам, маршруты
+        добавляются в индекс без его перестроения. Время обработки зависит
+        только от размера пакета. Если указан data_path, пакет дописывается
+        в CSV с историей перевозок.
+        """
+        with self._ingest_lock:
+            return self._ingest(routes, data_path)[0]
+
+    def _ingest(self, routes: List[Dict], data_path: Optional[str] = None) -> Tuple[Dict, np.ndarray]:
+        """Дообучение на копиях скейлера, модели и индекса с подменой одним шагом.
+
+        Запросы, которые выполняются одновременно с дообучением, видят либо
+        прежнее состояние целиком, либо новое. Вызывается под _ingest_lock.
+        Возвращает результат и кластеры добавленных маршрутов.
+        """
+        if self.model is None or self.route_index is None:
+            raise ValueError("Модель не обучена")
+        if self.inference_only:
+            raise ValueError("Модель загружена только для выдачи рекомендаций, дообучение недоступно")
+        if not routes:
+            return {'ingested': 0, 'n_samples': self.n_samples}, np.empty(0, dtype=np.int64)
+            
+        import pandas as pd
+        batch = pd.DataFrame(routes, columns=list(CARGO_DTYPES))
+        if batch.isnull().values.any():
+            raise ValueError("Не заполнены обязательные поля маршрута")
+        X = batch[FEATURES].to_numpy(dtype=np.float64)
+        
+        # Обновление статистики скейлера. Центры пересчитываются в новую шкалу,
+        # чтобы в исходном пространстве признаков они остались на месте
+        scaler = copy.deepcopy(self.scaler)
+        scaler.partial_fit(X)
+        centers = (self.model.cluster_centers_ * self.scaler.scale_ + self.scaler.mean_ - scaler.mean_) / scaler.scale_
+        # Неглубокая копия: обучающие метки модели не копируются
+        model = copy.copy(self.model)
+        model.cluster_centers_ = centers
+        
+        # Распределение новых маршрутов по кластерам
+        X_scaled = scaler.transform(X)
+        clusters = model.predict(X_scaled)
+        
+        # Сдвиг центров к среднему с учетом новых точек (онлайн-обновление k-means)
+        added = np.bincount(clusters, minlength=len(centers))
+        sums = np.zeros_like(centers)
+        np.add.at(sums, clusters, X_scaled)
+        counts = self.cluster_counts + added
+        changed = added > 0
+        centers[changed] = (
+            centers[changed] * self.cluster_counts[changed, None] + sums[changed]
+        ) / counts[changed, None]
+        model.cluster_centers_ = centers
+        
+        route_index = self.route_index.copy()
+        route_index.insert(batch['route_id'].to_numpy(), X, batch['success_rate'].to_numpy(), clusters)
+        with self._state_lock:
+            self.scaler, self.model, self.route_index = scaler, model, route_index
+            self.cluster_counts = counts
+            self.revision = uuid.uuid4().hex
+            self._report_key = None
+        
+        batch['cluster'] = clusters
+        if self._data is not None:
+            self._ingested.append(batch)
+        if data_path is not None:
+            _append_csv(data_path, batch[list(CARGO_DTYPES)])
+            
+        return {'ingested': len(batch), 'n_samples': self.n_samples}, clusters
+        
+    def ingest_routes_shared(self, routes: List[Dict], path: str = "cargo_model",
+                             data_path: Optional[str] = None) -> Dict:
+        """Добавление маршрутов с записью пакета в журнал опубликованной версии.
+
+        Другие процессы, загрузившие ту же версию, применяют журнал через
+        replay_ingest_log, а при загрузке версии он применяется целиком.
+        Поэтому все рабочие процессы API и перезапущенный сервис видят одни
+        и те же маршруты.
+        """
+        if not routes or not model_artifact.version_exists(path, self.model_version or ''):
+            return self.ingest_routes(routes, data_path=data_path)
+        with self._ingest_lock, model_artifact.ingest_lock(path, self.model_version):
+            # Сначала пакеты других процессов: порядок применения везде одинаков
+            self._replay(path)
+            result, clusters = self._ingest(routes, data_path=data_path)
+            # Кластер сохраняется в журнале: процессы только для вывода добавляют
+            # маршруты в индекс по нему, без scikit-learn
+            logged = [dict(route, cluster=int(c)) for route, c in zip(routes, clusters)]
+            self._ingest_offset = model_artifact.append_ingest(path, self.model_version, logged)
+        return result
+        
+    def replay_ingest_log(self, path: str = "cargo_model") -> int:
+        """Применение пакетов журнала добавлений, записанных другими процессами.
+
+        Возвращает число примененных пакетов. Модель, загруженная только для
+        выдачи рекомендаций, добавляет маршруты в индекс по записанным в журнале
+        кластерам, а скейлер и центры кластеров остаются такими, как при публикации.
+        """
+        if not model_artifact.version_exists(path, self.model_version or ''):
+            return 0
+        with self._ingest_lock:
+            return self._replay(path)
+            
+    def _replay(self, path: str) -> int:
+        batches, offset = model_artifact.read_ingest(path, self.model_version, self._ingest_offset)
+        for routes in batches:
+            if self.inference_only:
+                self._insert_logged(routes)
+            else:
+                self._ingest(routes)
+        self._ingest_offset = offset
+        return len(batches)
+
+    def _insert_logged(self, routes: List[Dict]):
+        """Добавление пакета журнала в индекс без изменения модели (только NumPy)"""
+        if self.route_index is None or not routes:
+            return
+        X = np.array([[route[f] for f in FEATURES] for route in routes], dtype=np.float64)
+        if all('cluster' in route for route in routes):
+            clusters = np.array([route['cluster'] for route in routes], dtype=np.int64)
+        else:
+            # Пакеты, записанные до появления кластеров в журнале
+            clusters = self.model.predict(self.scaler.transform(X))
+        route_index = self.route_index.copy()
+        route_index.insert(np.array([route['route_id'] for route in routes]), X,
+                           np.array([route['success_rate'] for route in routes], dtype=np.float64), clusters)
+        with self._state_lock:
+            self.route_index = route_index
+            self.revision = uuid.uuid4().hex
+            self._report_key = None
+        
+    def get_route_recommendations(self, cargo_data: Dict) -> List[Dict]:
+        """Получение рекомендаций по маршрутам"""
+        return self.get_route_recommendations_batch([cargo_data])[0]
+        
+    def get_route_recommendations_batch(self, cargo_list: List[Dict]) -> List[List[Dict]]:
+        """Получение рекомендаций по маршрутам для пакета грузов"""
+        if self.model is None:
+            raise ValueError("Модель не обучена")
+        if self.route_index is None:
+            raise ValueError("Индекс маршрутов не построен")
+        if not cargo_list:
+            return []
+            
+        # Преобразование входных данных в одну матрицу признаков
+        return self._route_recommendations_matrix(cargo_matrix(cargo_list))
+        
+    def _route_recommendations_matrix(self, input_features: np.ndarray) -> List[List[Dict]]:
+        """Рекомендации по маршрутам для готовой матрицы признаков"""
+        scaler, model, route_index = self._serving()
+        # Масштабирование и определение кластеров одним вызовом на весь пакет
+        with metrics.ROUTE_STAGE_SECONDS.time(stage='scale'):
+            input_scaled = scaler.transform(input_features)
+        with metrics.ROUTE_STAGE_SECONDS.time(stage='predict'):
+            clusters = model.predict(input_scaled)
+        
+        # Каждый кластер запрашивается из индекса только один раз.
+        # Индекс заранее отсортирован, поэтому отдельного этапа сортировки нет
+        with metrics.ROUTE_STAGE_SECONDS.time(stage='cluster_filter'):
+            by_cluster = {
+                int(cluster): route_index.top_k(int(cluster), k=5)
+                for cluster in np.unique(clusters)
+            }
+        
+        # Результаты возвращаются в порядке входных данных
+        return [list(by_cluster[int(cluster)]) for cluster in clusters]
+        
+    def recommend_all(self, cargo_data: Dict, sections: Optional[List[str]] = None) -> Dict:
+        """Сводная рекомендация: маршруты, транспорт, стоимость и погода в одном ответе"""
+        return self.recommend_all_batch([cargo_data], sections)[0]
+        
+    def recommend_all_batch(self, cargo_list: List[Dict], sections: Optional[List[str]] = None) -> List[Dict]:
+        """Сводные рекомендации для пакета грузов.
+
+        Матрица признаков строится один раз и разделяется всеми разделами:
+        маршруты получают ее целиком (одно масштабирование и предсказание
+        кластеров на пакет), правила - ее столбцы без копирования.
+        sections ограничивает набор вычисляемых разделов.
+        """
+        return self.recommend_all_matrix(cargo_matrix(cargo_list), sections)
+        
+    def recommend_all_matrix(self, input_features: np.ndarray, sections: Optional[List[str]] = None) -> List[Dict]:
+        """Сводные рекомендации для готовой матрицы признаков (столбцы в порядке FEATURES)"""
+        sections = RECOMMENDATION_SECTIONS if sections is None else sections
+        unknown = [section for section in sections if section not in RECOMMENDATION_SECTIONS]
+        if unknown:
+            raise ValueError(f"Неизвестные разделы рекомендаций: {', '.join(unknown)}")
+            
+        columns = matrix_columns(input_features)
+        results = [{} for _ in range(len(input_features))]
+        computed = {}
+        if 'routes' in sections:
+            if self.model is None:
+                raise ValueError("Модель не обучена")
+            if self.route_index is None:
+                raise ValueError("Индекс маршрутов не построен")
+            computed['routes'] = self._route_recommendations_matrix(input_features) if len(input_features) else []
+        if 'vehicles' in sections:
+            computed['vehicles'] = self.rules.vehicle_recommendations(columns)
+        if 'cost_optimization' in sections:
+            computed['cost_optimization'] = self.rules.cost_optimization(columns)
+        if 'weather' in sections:
+            computed['weather'] = self.rules.weather_recommendations(columns)
+            
+        for section, values in computed.items():
+            for result, value in zip(results, values):
+                result[section] = value
+        return results
+        
+    def find_similar_routes(self, cargo_data: Dict, k: int = 5, n_probe: int = 8,
+                            success_weight: float = 0.0) -> List[Dict]:
+        """Поиск ближайших исторических маршрутов с расстояниями.
+
+        Просматриваются n_probe ячеек индекса с ближайшими к грузу центрами,
+        поэтому маршруты из соседних кластеров тоже могут попасть в ответ.
+        success_weight > 0 повышает в выдаче маршруты с высокой успешностью.
+        """
+        if self.model is None:
+            raise ValueError("Модель не обучена")
+        if self.route_index is None:
+            raise ValueError("Индекс маршрутов не построен")
+            
+        query = np.array([[
+            cargo_data['weight'],
+            cargo_data['distance'],
+            cargo_data['delivery_time'],
+            cargo_data['cost']
+        ]], dtype=float)
+        scaler, model, route_index = self._serving()
+        query_scaled = scaler.transform(query)[0]
+        
+        return route_index.nearest(
+            query_scaled, model.cluster_centers_, scaler.mean_, scaler.scale_,
+            k=k, n_probe=n_probe, success_weight=success_weight
+        )
+        
+    def reload_rules(self, path: Optional[str] = None):
+        """Перезагрузка таблицы правил без перезапуска сервиса"""
+        self.rules = RuleEngine.load(path) if path else RuleEngine.load()
+        self.revision = uuid.uuid4().hex
+        
+    def refresh_rules(self) -> bool:
+        """Перезагрузка правил, если их файл изменился (например, другим процессом)"""
+        if not self.rules.file_changed():
+            return False
+        self.reload_rules(self.rules.path)
+        return True
+        
+    def get_vehicle_recommendations(self, cargo_data: Dict) -> List[Dict]:
+        """Рекомендации по выбору транспорта"""
+        return self.get_vehicle_recommendations_batch([cargo_data])[0]
+        
+    def get_vehicle_recommendations_batch(self, cargo_list: List[Dict]) -> List[List[Dict]]:
+        """Рекомендации по выбору транспорта для пакета грузов"""
+        return self.rules.vehicle_recommendations(cargo_columns(cargo_list))
+        
+    def get_cost_optimization(self, cargo_data: Dict) -> Dict:
+        """Рекомендации по оптимизации стоимости"""
+        return self.get_cost_optimization_batch([cargo_data])[0]
+        
+    def get_cost_optimization_batch(self, cargo_list: List[Dict]) -> List[Dict]:
+        """Рекомендации по оптимизации стоимости для пакета грузов"""
+        return self.rules.cost_optimization(cargo_columns(cargo_list))
+        
+    def get_weather_recommendations(self, cargo_data: Dict) -> Dict:
+        """Рекомендации с учетом погодных условий"""
+        return self.get_weather_recommendations_batch([cargo_data])[0]
+        
+    def get_weather_recommendations_batch(self, cargo_list: List[Dict]) -> List[Dict]:
+        """Рекомендации с учетом погодных условий для пакета грузов"""
+        # Примеры рекомендаций (в реальной системе здесь был бы API погоды)
+        return self.rules.weather_recommendations(cargo_columns(cargo_list))
+
+    def plan_loads(self, cargo_list: List[Dict], **options) -> Dict:
+        """Консолидация грузов по рейсам транспорта из таблицы правил (параметры - load_planner.plan_loads)"""
+        return load_planner.plan_loads(self.rules, cargo_list, **options)
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from benchmark import latency_stats
+
+def read_log(path: str, limit: Optional[int] = None) -> List[Dict]:
+    """Записи журнала запросов (формат request_log.RequestLogger)"""
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            records.append(json.loads(line))
+            if limit is not None and len(records) >= limit:
+                break
+    return records
+
+def send(client, record: Dict):
+    """Повтор одного запроса; возвращает код ответа и задержку в секундах"""
+    url = record['path'] + (f"?{record['query']}" if record.get('query') else '')
+    start = time.perf_counter()
+    if record['method'] == 'GET':
+        response = client.get(url)
+    else:
+        response = client.request(record['method'], url, json=record.get('body'))
+    return response.status_code, time.perf_counter() - start
+
+def replay(client, records: List[Dict], concurrency: int = 8, rate: Optional[float] = None) -> Dict:
+    """Воспроизведение журнала.
+
+    Без rate запросы идут замкнутым циклом: concurrency потоков отправляют
+    следующий запрос сразу после ответа на предыдущий. С rate запросы
+    отправляются по расписанию (rate в секунду) независимо от ответов,
+    а concurrency ограничивает число одновременно ожидающих ответов.
+    В этом режиме задержка считается от запланированного момента отправки,
+    чтобы очередь перед перегруженным приложением входила в результат.
+    """
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def run(record, scheduled):
+        status, elapsed = send(client, record)
+        if scheduled is not None:
+            elapsed = time.perf_counter() - scheduled
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i, record in enumerate(records):
+            scheduled = None
+            if rate:
+                scheduled = start + i / rate
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            executor.submit(run, record, scheduled)
+    elapsed = time.perf_counter() - start
+
+    errors = sum(count for status, count in statuses.items() if status >= 500)
+    return {
+        'requests': len(records),
+        'concurrency': concurrency,
+        'rate': rate,
+        'duration_s': elapsed,
+        'throughput_rps': len(records) / elapsed if elapsed else 0.0,
+        'errors': errors,
+        'status_codes': {str(status): count for status, count in sorted(statuses.items())},
+        'latency': latency_stats(latencies) if latencies else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение журнала запросов на приложении в том же процессе")
+    parser.add_argument('log', help="Журнал запросов в формате JSON Lines (CARGO_REQUEST_LOG)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Число одновременных запросов")
+    parser.add_argument('--rate', type=float, default=None, help="Запросов в секунду (по умолчанию - без ограничения)")
+    parser.add_argument('--limit', type=int, default=None, help="Воспроизвести только первые N запросов")
+    parser.add_argument('--warmup', type=int, default=10, help="Число запросов для прогрева перед замером")
+    parser.add_argument('--output', default=None, help="Файл для результатов в JSON")
+    args = parser.parse_args()
+
+    import warnings
+    warnings.filterwarnings('ignore')
+    # Воспроизводимые запросы не должны снова попадать в журнал
+    os.environ.pop("CARGO_REQUEST_LOG", None)
+    from fastapi.testclient import TestClient
+    import api
+
+    records = read_log(args.log, args.limit)
+    if not records:
+        print("Журнал пуст")
+        return
+    with TestClient(api.app) as client:
+        for record in records[:args.warmup]:
+            send(client, record)
+        report = replay(client, records, args.concurrency, args.rate)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
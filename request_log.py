@@ -0,0 +1,83 @@
+import json
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional
+
+class RequestLogger:
+    """Буферизованная запись запросов в файл JSON Lines.
+
+    log() только кладет запись в очередь и не ждет диска; фоновый поток
+    копит записи не дольше flush_interval секунд и дописывает пачку в
+    файл одним вызовом write.
+    Если очередь переполнена (диск не успевает), запись отбрасывается
+    и учитывается в счетчике dropped, а обработка запроса не замедляется.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, max_queue: int = 100_000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="request-log", daemon=True)
+        self._thread.start()
+
+    def log(self, record: Dict):
+        """Постановка записи в очередь без ожидания записи на диск"""
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _collect(self) -> list:
+        """Пачка записей, накопленная за flush_interval после первой; None в конце - сигнал остановки"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while batch[-1] is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            while True:
+                batch = self._collect()
+                stop = batch[-1] is None
+                if stop:
+                    batch.pop()
+                if batch:
+                    f.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in batch))
+                    f.flush()
+                    self.written += len(batch)
+                if stop:
+                    return
+
+    def close(self):
+        """Запись оставшихся записей и остановка фонового потока"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self) -> Dict:
+        return {'path': self.path, 'written': self.written, 'dropped': self.dropped, 'queued': self._queue.qsize()}
+
+def from_env() -> Optional[RequestLogger]:
+    """Журнал запросов, если задан путь CARGO_REQUEST_LOG (иначе журналирование выключено)"""
+    path = os.environ.get("CARGO_REQUEST_LOG")
+    if not path:
+        return None
+    return RequestLogger(path, flush_interval=float(os.environ.get("CARGO_REQUEST_LOG_FLUSH", 1.0)))
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict
+
+from route_index import FEATURES
+
+class ResponseCache:
+    """LRU-кеш ответов с ограниченным временем жизни записей.
+
+    Ключ строится по признакам груза, округленным до precision знаков
+    (отрицательное значение округляет до десятков, сотен и т.д.), поэтому
+    почти одинаковые запросы получают один ответ. Версия модели входит в
+    ключ, поэтому ответы разных моделей (например, при A/B-тесте) хранятся
+    раздельно, а записи устаревших версий вытесняются по LRU и TTL.
+
+    Кешировать можно только ответы, которые зависят от груза через кластер
+    (рекомендации маршрутов). Ответы правил зависят от точных порогов и
+    стоимости груза, и округленный ключ отдал бы им чужой ответ.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl: float = 300.0, precision: int = 0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def make_key(self, name: str, cargo_data: Dict) -> tuple:
+        return (name,) + tuple(round(float(cargo_data[f]), self.precision) for f in FEATURES)
+
+    def get_or_compute(self, name: str, cargo_data: Dict, version, compute: Callable):
+        """Ответ из кеша или результат compute() для промаха"""
+        key = (version,) + self.make_key(name, cargo_data)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Вычисление вне блокировки, чтобы медленный промах не задерживал попадания
+        value = compute()
+
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Счетчики попаданий и промахов"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'precision': self.precision,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0
+            }
@@ -0,0 +1,416 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Столбцы файла ребер; time необязателен и по умолчанию равен distance / speed
+EDGE_COLUMNS = ['source', 'target', 'distance', 'time']
+
+# Массивы сети, сохраняемые в отдельные .npy файлы
+STORE_COLUMNS = ['node_ids', 'indptr', 'indices', 'distance', 'time',
+                 'hubs', 'hub_dist', 'cell_order', 'cell_ptr', 'cell_low', 'cell_high']
+
+META_FILE = 'meta.json'
+# Хабы задают нижние и верхние оценки расстояний, по которым отбираются ячейки для поиска
+DEFAULT_HUBS = 16
+# Средний размер ячейки (узлов): поиск просматривает только ячейки, через которые может пройти путь
+DEFAULT_CELL_SIZE = 150
+# Во сколько раз растет радиус поиска, если путь не найден (начальный радиус - нижняя оценка)
+RADIUS_GROWTH = 1.08
+# Средняя скорость (единиц distance за единицу delivery_time) для ребер без времени
+DEFAULT_SPEED = 50.0
+DEFAULT_CACHE_SIZE = 100_000
+
+def _ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Номера элементов из отрезков [starts[i], starts[i] + counts[i]) подряд"""
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(int(counts.sum()))
+
+def _csr(source: np.ndarray, target: np.ndarray, n_nodes: int, *weights: np.ndarray) -> tuple:
+    """Списки смежности в формате CSR: indptr, соседи и веса ребер, упорядоченные по source"""
+    order = np.argsort(source, kind='stable')
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(source, minlength=n_nodes)))).astype(np.int64)
+    return (indptr, target[order]) + tuple(w[order] for w in weights)
+
+class RoadNetwork:
+    """Дорожный граф для расчета расстояния и времени между узлами.
+
+    Граф хранится в виде массивов CSR. Для нескольких узлов-хабов заранее
+    посчитаны расстояния от хаба до всех узлов и от всех узлов до хаба
+    (hub_dist, строка - узел), по неравенству треугольника они дают
+    нижние и верхние оценки расстояния. Узлы разбиты на ячейки
+    (cell_order, cell_ptr), для каждой ячейки хранятся наименьшие и
+    наибольшие расстояния до хабов (cell_low, cell_high). Запрос
+    отбирает ячейки, через которые может пройти путь не длиннее радиуса,
+    и ищет путь алгоритмом Дейкстры scipy в подграфе этих ячеек. Маршрут
+    ищется по расстоянию, время суммируется по ребрам найденного пути.
+    Ответы для пар (откуда, куда) хранятся в LRU-кеше.
+    """
+
+    def __init__(self, node_ids, indptr, indices, distance, time, hubs, hub_dist,
+                 cell_order, cell_ptr, cell_low, cell_high, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.node_ids = node_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.distance = distance
+        self.time = time
+        self.hubs = hubs
+        self.hub_dist = hub_dist
+        self.cell_order = cell_order
+        self.cell_ptr = cell_ptr
+        self.cell_low = cell_low
+        self.cell_high = cell_high
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # Погрешность оценок по таблицам float32
+        finite = cell_high[np.isfinite(cell_high)]
+        self._tolerance = 1e-6 * float(finite.max()) if len(finite) else 0.0
+        # Номера узлов в подграфе запроса; свои у каждого потока
+        self._local = threading.local()
+
+    @classmethod
+    def from_edges(cls, source, target, distance, time=None, speed: float = DEFAULT_SPEED,
+                   undirected: bool = False, n_hubs: int = DEFAULT_HUBS, cell_size: int = DEFAULT_CELL_SIZE,
+                   cache_size: int = DEFAULT_CACHE_SIZE) -> 'RoadNetwork':
+        """Построение сети по спискам ребер, расчет таблиц хабов и разбиение на ячейки"""
+        distance = np.asarray(distance, dtype=np.float64)
+        time = distance / speed if time is None else np.asarray(time, dtype=np.float64)
+        if len(distance) and (distance.min() < 0 or time.min() < 0):
+            raise ValueError("Длина и время ребер должны быть неотрицательными")
+
+        node_ids, nodes = np.unique(np.concatenate([np.asarray(source), np.asarray(target)]), return_inverse=True)
+        source, target = nodes[:len(distance)], nodes[len(distance):]
+        if undirected:
+            source, target = np.concatenate([source, target]), np.concatenate([target, source])
+            distance, time = np.tile(distance, 2), np.tile(time, 2)
+
+        # Из параллельных ребер остается кратчайшее
+        order = np.lexsort((distance, target, source))
+        source, target, distance, time = source[order], target[order], distance[order], time[order]
+        keep = np.ones(len(source), dtype=bool)
+        keep[1:] = (source[1:] != source[:-1]) | (target[1:] != target[:-1])
+        source, target, distance, time = source[keep], target[keep], distance[keep], time[keep]
+
+        n_nodes = len(node_ids)
+        source = source.astype(np.int32)
+        target = target.astype(np.int32)
+        indptr, indices, dist, tm = _csr(source, target, n_nodes, distance, time)
+
+        hubs, hub_dist = cls._hub_tables(indptr, indices, dist, n_nodes, n_hubs, symmetric=undirected)
+        cells = cls._cells(indptr, indices, dist, hub_dist, cell_size)
+        return cls(node_ids, indptr, indices, dist, tm, hubs, hub_dist, *cells, cache_size=cache_size)
+
+    @staticmethod
+    def _hub_tables(indptr, indices, distance, n_nodes: int, n_hubs: int, symmetric: bool) -> tuple:
+        """Выбор хабов и таблица расстояний [от хаба до узла | от узла до хаба] (строка - узел).
+
+        Первый хаб - узел с наибольшей степенью, каждый следующий - самый
+        далекий от уже выбранных: такие хабы дают наиболее точные оценки.
+        """
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import dijkstra
+
+        n_hubs = min(n_hubs, n_nodes)
+        if n_hubs == 0:
+            return np.zeros(0, dtype=np.int32), np.zeros((n_nodes, 0), dtype=np.float32)
+
+        graph = csr_matrix((distance, indices, indptr), shape=(n_nodes, n_nodes))
+        hubs = [int(np.argmax(np.diff(indptr)))]
+        nearest = dijkstra(graph, indices=hubs[0])
+        rows = [nearest]
+        while len(hubs) < n_hubs:
+            # Недостижимые узлы не годятся в хабы: по ним нельзя получить оценку
+            candidate = np.where(np.isfinite(nearest), nearest, -1)
+            candidate[hubs] = -1
+            hub = int(np.argmax(candidate))
+            if candidate[hub] <= 0:
+                break
+            hubs.append(hub)
+            rows.append(dijkstra(graph, indices=hub))
+            nearest = np.minimum(nearest, rows[-1])
+
+        hub_from = np.array(rows, dtype=np.float32)
+        hub_to = hub_from if symmetric else dijkstra(graph.T.tocsr(), indices=hubs).astype(np.float32)
+        return np.array(hubs, dtype=np.int32), np.ascontiguousarray(np.concatenate([hub_from, hub_to]).T)
+
+    @staticmethod
+    def _cells(indptr, indices, distance, hub_dist, cell_size: int) -> tuple:
+        """Разбиение узлов на ячейки и границы расстояний до хабов в каждой ячейке.
+
+        Ячейка - узлы, ближайшие к одному из случайных центров. Узлы,
+        недостижимые из центров, образуют последнюю ячейку.
+        """
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import dijkstra
+
+        n_nodes = len(indptr) - 1
+        n_cells = min(max(n_nodes // max(cell_size, 1), 1), n_nodes)
+        if n_cells == 0:
+            return (np.zeros(0, dtype=np.int32), np.zeros(1, dtype=np.int64),
+                    np.zeros((0, hub_dist.shape[1]), dtype=np.float32), np.zeros((0, hub_dist.shape[1]), dtype=np.float32))
+
+        graph = csr_matrix((distance, indices, indptr), shape=(n_nodes, n_nodes))
+        centers = np.random.default_rng(0).choice(n_nodes, n_cells, replace=False)
+        _, _, nearest = dijkstra(graph, indices=centers, min_only=True, return_predecessors=True)
+        center_cell = np.full(n_nodes, n_cells, dtype=np.int64)
+        center_cell[centers] = np.arange(n_cells)
+        cell = np.where(nearest >= 0, center_cell[np.maximum(nearest, 0)], n_cells)
+
+        n_cells += 1
+        order = np.argsort(cell, kind='stable').astype(np.int32)
+        ptr = np.concatenate(([0], np.cumsum(np.bincount(cell, minlength=n_cells)))).astype(np.int64)
+        low = np.full((n_cells, hub_dist.shape[1]), np.inf, dtype=np.float32)
+        high = np.full((n_cells, hub_dist.shape[1]), -np.inf, dtype=np.float32)
+        np.minimum.at(low, cell, hub_dist)
+        np.maximum.at(high, cell, hub_dist)
+        return order, ptr, low, high
+
+    @classmethod
+    def read_edges(cls, path: str, speed: float = DEFAULT_SPEED, undirected: bool = False,
+                   n_hubs: int = DEFAULT_HUBS, cell_size: int = DEFAULT_CELL_SIZE,
+                   cache_size: int = DEFAULT_CACHE_SIZE) -> 'RoadNetwork':
+        """Сеть из CSV-файла ребер со столбцами source, target, distance и необязательным time"""
+        import pandas as pd
+        edges = pd.read_csv(path, usecols=lambda c: c in EDGE_COLUMNS)
+        missing = [c for c in EDGE_COLUMNS[:3] if c not in edges]
+        if missing:
+            raise ValueError(f"В файле ребер нет столбцов: {', '.join(missing)}")
+        time = edges['time'].to_numpy() if 'time' in edges else None
+        return cls.from_edges(edges['source'].to_numpy(), edges['target'].to_numpy(), edges['distance'].to_numpy(),
+                              time, speed=speed, undirected=undirected, n_hubs=n_hubs, cell_size=cell_size,
+                              cache_size=cache_size)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in STORE_COLUMNS)
+
+    def save(self, directory: str, meta: Optional[Dict] = None):
+        """Сохранение массивов сети в .npy; meta записывается последним как признак готовности"""
+        os.makedirs(directory, exist_ok=True)
+        for name in STORE_COLUMNS:
+            # Временный файл свой у каждого процесса: сеть могут строить несколько рабочих процессов сразу
+            path = os.path.join(directory, f"{name}.npy")
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                np.save(f, np.ascontiguousarray(getattr(self, name)))
+            os.replace(tmp, path)
+        path = os.path.join(directory, META_FILE)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta or {}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    @classmethod
+    def open(cls, directory: str, mmap: bool = True, cache_size: int = DEFAULT_CACHE_SIZE) -> 'RoadNetwork':
+        """Открытие сохраненной сети; при mmap=True процессы разделяют одну копию массивов"""
+        mmap_mode = 'r' if mmap else None
+        columns = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in STORE_COLUMNS
+        }
+        return cls(**columns, cache_size=cache_size)
+
+    def node_index(self, node_id) -> int:
+        """Внутренний номер узла по его идентификатору из файла ребер"""
+        i = int(np.searchsorted(self.node_ids, node_id))
+        if i >= len(self.node_ids) or self.node_ids[i] != node_id:
+            raise KeyError(node_id)
+        return i
+
+    def _positions(self) -> np.ndarray:
+        """Номера узлов в подграфе запроса (-1 - узел не входит); массив свой у каждого потока"""
+        position = getattr(self._local, 'position', None)
+        if position is None:
+            position = self._local.position = np.full(self.n_nodes, -1, dtype=np.int32)
+        return position
+
+    def _bounds(self, s: int, t: int) -> Tuple[float, float, np.ndarray]:
+        """Нижняя и верхняя оценки d(s, t) и нижние оценки длины пути через каждую ячейку.
+
+        Строка таблицы хабов - [d(h, v) | d(v, h)]. Для узла v
+        d(s, v) >= max(d(h, v) - d(h, s), d(s, h) - d(v, h)) и
+        d(v, t) >= max(d(h, t) - d(h, v), d(v, h) - d(t, h)); для ячейки
+        d(h, v) и d(v, h) заменяются наименьшим или наибольшим значением в ней.
+        """
+        n_hubs = len(self.hubs)
+        row_s = self.hub_dist[s].astype(np.float64)
+        row_t = self.hub_dist[t].astype(np.float64)
+        low, high = self.cell_low, self.cell_high
+        # inf - inf дают NaN только для хабов, недостижимых из концов маршрута; fmax пропускает NaN
+        with np.errstate(invalid='ignore'):
+            lower = np.fmax.reduce(np.concatenate([row_t[:n_hubs] - row_s[:n_hubs],
+                                                   row_s[n_hubs:] - row_t[n_hubs:]]), initial=0.0)
+            from_s = np.fmax.reduce(np.concatenate([low[:, :n_hubs] - row_s[:n_hubs],
+                                                    row_s[n_hubs:] - high[:, n_hubs:]], axis=1), axis=1, initial=0.0)
+            to_t = np.fmax.reduce(np.concatenate([row_t[:n_hubs] - high[:, :n_hubs],
+                                                  low[:, n_hubs:] - row_t[n_hubs:]], axis=1), axis=1, initial=0.0)
+        upper = float((row_s[n_hubs:] + row_t[:n_hubs]).min(initial=np.inf))
+        return float(lower), upper, from_s + to_t
+
+    def _search_cells(self, s: int, t: int, cells: np.ndarray, limit: float) -> Optional[Tuple[float, float]]:
+        """Кратчайший путь из s в t не длиннее limit в подграфе ячеек cells (None, если не найден)"""
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import dijkstra
+
+        nodes = self.cell_order[_ranges(self.cell_ptr[cells], self.cell_ptr[cells + 1] - self.cell_ptr[cells])]
+        position = self._positions()
+        position[nodes] = np.arange(len(nodes), dtype=np.int32)
+        try:
+            source, target = int(position[s]), int(position[t])
+            if source < 0 or target < 0:
+                return None
+            starts = self.indptr[nodes]
+            degree = self.indptr[nodes + 1] - starts
+            edges = _ranges(starts, degree)
+            heads = position[self.indices[edges]]
+            inside = heads >= 0
+            counts = np.bincount(np.repeat(np.arange(len(nodes)), degree)[inside], minlength=len(nodes))
+            graph = csr_matrix((self.distance[edges[inside]], heads[inside], np.concatenate(([0], np.cumsum(counts)))),
+                               shape=(len(nodes), len(nodes)))
+        finally:
+            position[nodes] = -1
+        dist, pred = dijkstra(graph, indices=source, limit=limit, return_predecessors=True)
+        if not np.isfinite(dist[target]):
+            return None
+
+        path = [target]
+        while path[-1] != source:
+            path.append(int(pred[path[-1]]))
+        route = nodes[np.array(path[::-1])]
+        starts = self.indptr[route[:-1]]
+        degree = self.indptr[route[:-1] + 1] - starts
+        edges = _ranges(starts, degree)
+        edges = edges[self.indices[edges] == np.repeat(route[1:], degree)]
+        return float(dist[target]), float(self.time[edges].sum())
+
+    def _search(self, s: int, t: int) -> Tuple[float, float]:
+        """Длина и время кратчайшего по расстоянию пути из s в t (inf, если пути нет).
+
+        Путь длины не больше радиуса проходит только через ячейки с нижней
+        оценкой не больше радиуса, поэтому найденный в них путь кратчайший.
+        Радиус начинается чуть выше нижней оценки d(s, t) и растет в
+        RADIUS_GROWTH раз до верхней оценки через хабы.
+        """
+        if s == t:
+            return 0.0, 0.0
+        lower, upper, through = self._bounds(s, t)
+        radius = lower * RADIUS_GROWTH if lower > 0 and np.isfinite(upper) else upper
+        while True:
+            radius = min(radius, upper)
+            found = self._search_cells(s, t, np.flatnonzero(through <= radius + self._tolerance),
+                                       radius + self._tolerance)
+            if found is not None:
+                return found
+            if radius >= upper:
+                break
+            radius *= RADIUS_GROWTH
+        # Оценки из таблиц float32 приближенные: если путь через хаб есть, но не найден, ищем во всем графе
+        if np.isfinite(upper):
+            found = self._search_cells(s, t, np.arange(len(self.cell_ptr) - 1), np.inf)
+            if found is not None:
+                return found
+        return float('inf'), float('inf')
+
+    def route(self, origin, destination) -> Dict:
+        """Расстояние и время в пути между узлами (с кешированием пары)"""
+        key = (origin, destination)
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return dict(value)
+            self.misses += 1
+
+        try:
+            s, t = self.node_index(origin), self.node_index(destination)
+        except KeyError as e:
+            raise ValueError(f"Узел {e.args[0]} отсутствует в дорожной сети")
+        distance, time = self._search(s, t)
+        if not np.isfinite(distance):
+            raise ValueError(f"Нет пути из узла {origin} в узел {destination}")
+        value = {'distance': distance, 'delivery_time': time}
+
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return dict(value)
+
+    def routes(self, origins: List, destinations: List) -> Tuple[np.ndarray, np.ndarray]:
+        """Расстояния и время для списков пар; для неизвестных узлов и пар без пути - NaN"""
+        distance = np.full(len(origins), np.nan)
+        time = np.full(len(origins), np.nan)
+        for i, (origin, destination) in enumerate(zip(origins, destinations)):
+            try:
+                value = self.route(origin, destination)
+            except ValueError:
+                continue
+            distance[i], time[i] = value['distance'], value['delivery_time']
+        return distance, time
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'nodes': self.n_nodes,
+                'edges': self.n_edges,
+                'hubs': len(self.hubs),
+                'cells': len(self.cell_ptr) - 1,
+                'memory_bytes': self.nbytes,
+                'cache_size': len(self._cache),
+                'cache_max_size': self.cache_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+def load(path: str, speed: float = DEFAULT_SPEED, undirected: bool = False, n_hubs: int = DEFAULT_HUBS,
+         cell_size: int = DEFAULT_CELL_SIZE, cache_size: int = DEFAULT_CACHE_SIZE) -> RoadNetwork:
+    """Дорожная сеть из файла ребер.
+
+    Построенная сеть с таблицами хабов и ячейками сохраняется в каталог <path>.index
+    и при следующих запусках открывается через mmap, пока не изменились
+    файл ребер или параметры построения.
+    """
+    stat = os.stat(path)
+    meta = {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns,
+            'speed': speed, 'undirected': undirected, 'n_hubs': n_hubs, 'cell_size': cell_size}
+    directory = f"{path}.index"
+    try:
+        with open(os.path.join(directory, META_FILE), encoding='utf-8') as f:
+            if json.load(f) == meta:
+                return RoadNetwork.open(directory, cache_size=cache_size)
+    except (OSError, ValueError):
+        pass
+    network = RoadNetwork.read_edges(path, speed=speed, undirected=undirected, n_hubs=n_hubs, cell_size=cell_size,
+                                     cache_size=cache_size)
+    network.save(directory, meta)
+    return network
+
+def from_env() -> Optional[RoadNetwork]:
+    """Дорожная сеть из файла CARGO_ROAD_NETWORK (без него расстояние передает клиент)"""
+    path = os.environ.get("CARGO_ROAD_NETWORK")
+    if not path:
+        return None
+    return load(
+        path,
+        speed=float(os.environ.get("CARGO_ROAD_SPEED", DEFAULT_SPEED)),
+        undirected=os.environ.get("CARGO_ROAD_UNDIRECTED", "").lower() in ("1", "true", "yes"),
+        n_hubs=int(os.environ.get("CARGO_ROAD_HUBS", DEFAULT_HUBS)),
+        cell_size=int(os.environ.get("CARGO_ROAD_CELL_SIZE", DEFAULT_CELL_SIZE)),
+        cache_size=int(os.environ.get("CARGO_ROAD_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+    )
@@ -0,0 +1,535 @@
+import copy
+import hashlib
+import numpy as np
+import os
+from typing import List, Dict
+
+FEATURES = ['weight', 'distance', 'delivery_time', 'cost']
+
+# Столбцы индекса, сохраняемые в отдельные .npy файлы
+STORE_COLUMNS = ['route_id', 'features', 'success_rate', 'cluster', 'offsets']
+# Ячейки грубого квантователя; в индексах, сохраненных без них, файлов нет
+CELL_COLUMNS = ['cell_order', 'cell_offsets', 'cell_centers', 'cell_bounds', 'cell_scale']
+
+# Число итераций Лойда и размер выборки (в ячейках) при построении ячеек кластера
+CELL_ITERATIONS = 10
+CELL_SAMPLE_PER_CELL = 50
+# Размер блока маршрутов при назначении ячеек, чтобы матрица расстояний помещалась в памяти
+CELL_ASSIGN_CHUNK = 8192
+
+
+def _to_list(values) -> list:
+    """Преобразование массива в список вещественных чисел Python"""
+    # float32 выводится в кратчайшем десятичном виде, без хвоста вида 0.949999988
+    if values.dtype == np.float32:
+        return [float(str(value)) for value in values]
+    return values.astype(np.float64).tolist()
+
+
+def store_dtypes(n_clusters: int) -> Dict[str, np.dtype]:
+    """Компактные типы столбцов индекса для хранения на диске"""
+    return {
+        'route_id': np.int32,
+        'features': np.float32,
+        'success_rate': np.float32,
+        'cluster': np.uint8 if n_clusters <= 256 else np.int16,
+        'offsets': np.int64,
+        'cell_order': np.int32,
+        'cell_offsets': np.int64,
+        'cell_centers': np.float32,
+        'cell_bounds': np.int64,
+        'cell_scale': np.float64
+    }
+
+
+def _nearest_center(points, centers, scale=1.0) -> np.ndarray:
+    """Номер ближайшего центра для каждой точки (обработка блоками).
+
+    Точки делятся на scale поблочно, поэтому отображенные в память признаки
+    не копируются целиком.
+    """
+    centers_norm = (centers ** 2).sum(axis=1)
+    result = np.empty(len(points), dtype=np.int32)
+    for start in range(0, len(points), CELL_ASSIGN_CHUNK):
+        block = np.asarray(points[start:start + CELL_ASSIGN_CHUNK], dtype=np.float64) / scale
+        # |x - c|^2 без постоянного слагаемого |x|^2
+        result[start:start + len(block)] = (centers_norm - 2 * block @ centers.T).argmin(axis=1)
+    return result
+
+
+def _kmeans(points, k: int, rng, scale=1.0) -> np.ndarray:
+    """Центры k ячеек по алгоритму Лойда на случайной выборке точек"""
+    sample_size = min(len(points), k * CELL_SAMPLE_PER_CELL)
+    # Возрастающие номера строк выборки читают отображенный файл последовательно
+    rows = np.sort(rng.choice(len(points), sample_size, replace=False))
+    sample = np.asarray(points[rows], dtype=np.float64) / scale
+    centers = sample[rng.choice(sample_size, k, replace=False)]
+    for _ in range(CELL_ITERATIONS):
+        labels = _nearest_center(sample, centers)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, sample)
+        # Пустая ячейка сохраняет прежний центр
+        filled = counts > 0
+        centers[filled] = sums[filled] / counts[filled, None]
+    return centers
+
+
+class StoreWriter:
+    """Запись столбцов индекса прямо в файлы .npy хранилища.
+
+    Позиция каждой строки в упорядоченном индексе известна заранее, поэтому
+    строки записываются частями сразу на свои места, без сборки всей таблицы
+    в памяти. Результат открывается через RouteIndex.open.
+    """
+
+    def __init__(self, directory: str, n_rows: int, n_clusters: int):
+        self.directory = directory
+        self.n_clusters = n_clusters
+        os.makedirs(directory, exist_ok=True)
+        dtypes = store_dtypes(n_clusters)
+        shapes = {'route_id': (n_rows,), 'features': (n_rows, len(FEATURES)),
+                  'success_rate': (n_rows,), 'cluster': (n_rows,)}
+        self.columns = {
+            name: np.lib.format.open_memmap(os.path.join(directory, f"{name}.npy"), mode='w+',
+                                            dtype=dtypes[name], shape=shape)
+            for name, shape in shapes.items()
+        }
+
+    def write(self, positions, route_id, features, success_rate, cluster):
+        """Запись части строк в позиции positions"""
+        self.columns['route_id'][positions] = route_id
+        self.columns['features'][positions] = features
+        self.columns['success_rate'][positions] = success_rate
+        self.columns['cluster'][positions] = cluster
+
+    def close(self, offsets):
+        """Сброс файлов на диск и запись границ кластеров"""
+        for column in self.columns.values():
+            column.flush()
+        self.columns = {}
+        np.save(os.path.join(self.directory, 'offsets.npy'), np.asarray(offsets, dtype=np.int64))
+
+
+class RouteIndex:
+    """Индекс маршрутов, сгруппированных по кластерам.
+
+    Все маршруты хранятся в непрерывных массивах, упорядоченных по кластеру,
+    а внутри кластера - по убыванию success_rate. Маршруты кластера c
+    занимают срез offsets[c]:offsets[c + 1], поэтому top-k - это просто срез.
+
+    Новые маршруты добавляются небольшими отсортированными пакетами. Пакеты
+    близкого размера сливаются между собой (число пакетов растет логарифмически),
+    а с основными массивами - только когда их суммарный размер становится
+    сравним с размером индекса.
+
+    Для поиска ближайших маршрутов каждый кластер дополнительно делится
+    примерно на sqrt(n) ячеек (build_cells). Ячейки cell_bounds[c]:cell_bounds[c + 1]
+    принадлежат кластеру c; маршруты ячейки j - это позиции
+    cell_order[cell_offsets[j]:cell_offsets[j + 1]] в основных массивах.
+
+    Чтение (top_k, nearest, fingerprint, to_frame, save) индекс не меняет.
+    Индекс, который читают другие потоки, изменяется только через копию
+    (copy), которая затем подменяет его одним присваиванием.
+    """
+
+    # Пакеты сливаются с основными массивами, когда их размер превышает эту долю индекса
+    COMPACT_RATIO = 0.25
+
+    def __init__(self, route_id, features, success_rate, cluster, offsets,
+                 cell_order=None, cell_offsets=None, cell_centers=None, cell_bounds=None, cell_scale=None):
+        self.route_id = route_id
+        self.features = features
+        self.success_rate = success_rate
+        self.cluster = cluster
+        self.offsets = offsets
+        # Центры ячеек хранятся в исходных единицах признаков, cell_scale - масштаб,
+        # в котором ячейки строились и назначаются новым маршрутам
+        self.cell_order = cell_order
+        self.cell_offsets = cell_offsets
+        self.cell_centers = cell_centers
+        self.cell_bounds = cell_bounds
+        self.cell_scale = cell_scale
+        self._runs = []
+        self._pending = 0
+
+    @classmethod
+    def from_arrays(cls, route_id, features, success_rate, cluster, n_clusters: int = None) -> 'RouteIndex':
+        """Построение индекса по массивам столбцов"""
+        cluster = np.asarray(cluster)
+        success_rate = np.asarray(success_rate)
+
+        # Сортировка по кластеру, внутри кластера - по убыванию успешности.
+        # lexsort устойчив, поэтому при равной успешности сохраняется исходный порядок
+        order = np.lexsort((-success_rate, cluster))
+        sorted_clusters = cluster[order]
+
+        if n_clusters is None:
+            n_clusters = int(cluster.max()) + 1 if len(cluster) else 0
+        offsets = np.searchsorted(sorted_clusters, np.arange(n_clusters + 1))
+
+        return cls(
+            route_id=np.asarray(route_id)[order],
+            features=np.asarray(features)[order],
+            success_rate=success_rate[order],
+            cluster=sorted_clusters,
+            offsets=offsets
+        )
+
+    @classmethod
+    def build(cls, data, clusters, n_clusters: int = None) -> 'RouteIndex':
+        """Построение индекса по таблице маршрутов и меткам кластеров"""
+        return cls.from_arrays(
+            data['route_id'].to_numpy(),
+            data[FEATURES].to_numpy(),
+            data['success_rate'].to_numpy(),
+            clusters,
+            n_clusters=n_clusters
+        )
+
+    @property
+    def n_clusters(self) -> int:
+        return len(self.offsets) - 1
+
+    def __len__(self) -> int:
+        return len(self.route_id) + self._pending
+
+    @property
+    def has_cells(self) -> bool:
+        return self.cell_centers is not None
+
+    @property
+    def nbytes(self) -> int:
+        """Объем массивов индекса вместе с еще не слитыми добавлениями (байт)"""
+        arrays = [self.route_id, self.features, self.success_rate, self.cluster, self.offsets]
+        arrays += [getattr(self, name) for name in CELL_COLUMNS if getattr(self, name) is not None]
+        return sum(array.nbytes for array in arrays) + sum(run.nbytes for run in self._runs)
+
+    def build_cells(self, scale, seed: int = 0):
+        """Разбиение каждого кластера примерно на sqrt(n) ячеек.
+
+        Ячейки строятся алгоритмом Лойда в масштабированном пространстве
+        (scale - масштаб признаков модели), поэтому поиск ближайших маршрутов
+        просматривает порядка sqrt(n) маршрутов на ячейку, а не целый кластер.
+        """
+        self.compact()
+        rng = np.random.default_rng(seed)
+        scale = np.asarray(scale, dtype=np.float64)
+        centers, bounds, cell = [], [0], np.empty(len(self.route_id), dtype=np.int32)
+        for c in range(self.n_clusters):
+            s = self.cluster_slice(c)
+            points = self.features[s]
+            k = int(np.ceil(np.sqrt(len(points))))
+            if k:
+                cluster_centers = _kmeans(points, k, rng, scale)
+                cell[s] = bounds[-1] + _nearest_center(points, cluster_centers, scale)
+                centers.append(cluster_centers * scale)
+            bounds.append(bounds[-1] + k)
+
+        self.cell_centers = np.concatenate(centers) if centers else np.empty((0, len(FEATURES)))
+        self.cell_bounds = np.asarray(bounds, dtype=np.int64)
+        self.cell_scale = scale
+        self._set_cells(cell)
+
+    def _set_cells(self, cell):
+        """Построение cell_order и cell_offsets по номерам ячеек маршрутов"""
+        self.cell_order = np.argsort(cell, kind='stable').astype(np.int32)
+        self.cell_offsets = np.searchsorted(cell[self.cell_order], np.arange(len(self.cell_centers) + 1))
+
+    def _route_cells(self) -> np.ndarray:
+        """Номер ячейки каждого маршрута основных массивов"""
+        cell = np.empty(len(self.route_id), dtype=np.int32)
+        cell[self.cell_order] = np.repeat(np.arange(len(self.cell_offsets) - 1, dtype=np.int32),
+                                          np.diff(self.cell_offsets))
+        return cell
+
+    def _assign_cells(self, features, cluster) -> np.ndarray:
+        """Ближайшая ячейка своего кластера для новых маршрутов"""
+        cell = np.empty(len(cluster), dtype=np.int32)
+        for c in np.unique(cluster):
+            mask = cluster == c
+            start, stop = self.cell_bounds[c], self.cell_bounds[c + 1]
+            if stop == start:
+                # Кластер был пуст при построении ячеек: маршрутам нужна новая ячейка
+                self._add_cell(c, np.asarray(features)[mask].mean(axis=0))
+                start, stop = self.cell_bounds[c], self.cell_bounds[c + 1]
+            centers = np.asarray(self.cell_centers[start:stop], dtype=np.float64) / self.cell_scale
+            cell[mask] = start + _nearest_center(features[mask], centers, self.cell_scale)
+        return cell
+
+    def _add_cell(self, cluster: int, center):
+        """Добавление ячейки в конец ячеек кластера со сдвигом номеров последующих ячеек"""
+        position = int(self.cell_bounds[cluster + 1])
+        self.cell_centers = np.insert(np.asarray(self.cell_centers), position, center, axis=0)
+        self.cell_bounds = np.asarray(self.cell_bounds).copy()
+        self.cell_bounds[cluster + 1:] += 1
+        for index in [self] + self._runs:
+            cell = index._route_cells()
+            cell[cell >= position] += 1
+            index.cell_centers = self.cell_centers
+            index._set_cells(cell)
+
+    def ensure_n_clusters(self, n_clusters: int):
+        """Дополнение индекса пустыми кластерами до n_clusters.
+
+        Нужно для индексов, построенных без явного числа кластеров: если
+        последние кластеры модели пусты, offsets оказывается короче.
+        """
+        for index in [self] + self._runs:
+            missing = n_clusters - index.n_clusters
+            if missing > 0:
+                index.offsets = np.concatenate([index.offsets, np.full(missing, index.offsets[-1])])
+        if self.has_cells and len(self.cell_bounds) < n_clusters + 1:
+            missing = n_clusters + 1 - len(self.cell_bounds)
+            self.cell_bounds = np.concatenate([self.cell_bounds, np.full(missing, self.cell_bounds[-1])])
+
+    def cluster_slice(self, cluster: int) -> slice:
+        """Срез основных массивов индекса, занимаемый кластером"""
+        if cluster < 0 or cluster >= self.n_clusters:
+            return slice(0, 0)
+        return slice(self.offsets[cluster], self.offsets[cluster + 1])
+
+    def insert(self, route_id, features, success_rate, cluster):
+        """Добавление новых маршрутов за время, пропорциональное размеру пакета"""
+        cluster = np.asarray(cluster)
+        if len(cluster) and (cluster.min() < 0 or cluster.max() >= self.n_clusters):
+            raise ValueError(f"Номер кластера вне диапазона индекса (кластеров: {self.n_clusters})")
+        features = np.asarray(features, dtype=self.features.dtype)
+        run = RouteIndex.from_arrays(
+            np.asarray(route_id, dtype=self.route_id.dtype),
+            features,
+            np.asarray(success_rate, dtype=self.success_rate.dtype),
+            np.asarray(cluster, dtype=self.cluster.dtype),
+            n_clusters=self.n_clusters
+        )
+        if self.has_cells:
+            # Новые маршруты попадают в ближайшую ячейку своего кластера без перестроения ячеек
+            cell = self._assign_cells(run.features, run.cluster)
+            self._share_cells(run)
+            run._set_cells(cell)
+        self._runs.append(run)
+        self._pending += len(run)
+
+        if self._pending > self.COMPACT_RATIO * len(self.route_id):
+            self.compact()
+            return
+
+        # Сливаются только пакеты сопоставимого размера, как в LSM-дереве
+        while len(self._runs) > 1 and len(self._runs[-2]) <= 2 * len(self._runs[-1]):
+            self._runs[-2:] = [self._merge(self._runs[-2:])]
+
+    def _share_cells(self, index: 'RouteIndex'):
+        index.cell_centers = self.cell_centers
+        index.cell_bounds = self.cell_bounds
+        index.cell_scale = self.cell_scale
+
+    def _merge(self, parts: List['RouteIndex']) -> 'RouteIndex':
+        cluster = np.concatenate([p.cluster for p in parts])
+        success_rate = np.concatenate([p.success_rate for p in parts])
+        merged = RouteIndex.from_arrays(
+            np.concatenate([p.route_id for p in parts]),
+            np.concatenate([p.features for p in parts]),
+            success_rate,
+            cluster,
+            n_clusters=self.n_clusters
+        )
+        if self.has_cells:
+            # Номера ячеек переставляются тем же порядком, что и строки в from_arrays
+            cell = np.concatenate([p._route_cells() for p in parts])
+            order = np.lexsort((-success_rate, cluster))
+            self._share_cells(merged)
+            merged._set_cells(cell[order])
+        return merged
+
+    def copy(self) -> 'RouteIndex':
+        """Копия для изменения: массивы общие с исходным индексом, пакеты копируются"""
+        clone = copy.copy(self)
+        clone._runs = [copy.copy(run) for run in self._runs]
+        return clone
+
+    def _compacted(self) -> 'RouteIndex':
+        """Индекс с пакетами, слитыми с основными массивами, без изменения этого индекса"""
+        return self._merge([self] + self._runs) if self._runs else self
+
+    def compact(self):
+        """Слияние добавленных пакетов с основными массивами индекса"""
+        if not self._runs:
+            return
+        merged = self._compacted()
+        self.route_id = merged.route_id
+        self.features = merged.features
+        self.success_rate = merged.success_rate
+        self.cluster = merged.cluster
+        self.offsets = merged.offsets
+        self.cell_order = merged.cell_order
+        self.cell_offsets = merged.cell_offsets
+        self._runs = []
+        self._pending = 0
+
+    def compact_dtypes(self) -> Dict[str, np.dtype]:
+        """Компактные типы столбцов для хранения на диске"""
+        return store_dtypes(self.n_clusters)
+
+    def save(self, directory: str):
+        """Сохранение индекса в виде столбцов .npy с компактными типами"""
+        index = self._compacted()
+        os.makedirs(directory, exist_ok=True)
+        for name, dtype in self.compact_dtypes().items():
+            path = os.path.join(directory, f"{name}.npy")
+            if getattr(index, name) is None:
+                # Ячейки от прежнего индекса в том же каталоге не должны остаться
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            # Запись через временный файл: процессы, отобразившие старый файл, продолжают читать его
+            with open(f"{path}.tmp", 'wb') as f:
+                np.save(f, np.ascontiguousarray(getattr(index, name), dtype=dtype))
+            os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def open(cls, directory: str, mmap: bool = True) -> 'RouteIndex':
+        """Открытие сохраненного индекса.
+
+        При mmap=True файлы только отображаются в память, и несколько
+        процессов разделяют одну копию данных в страничном кеше ОС.
+        """
+        mmap_mode = 'r' if mmap else None
+        columns = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in STORE_COLUMNS
+        }
+        if os.path.exists(os.path.join(directory, 'cell_order.npy')):
+            # Центры ячеек невелики и читаются целиком
+            columns.update({
+                name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode if name == 'cell_order' else None)
+                for name in CELL_COLUMNS
+            })
+        return cls(**columns)
+
+    def fingerprint(self) -> str:
+        """Хеш маршрутов и меток кластеров индекса"""
+        index = self._compacted()
+        digest = hashlib.sha256()
+        for name in ('route_id', 'features', 'success_rate', 'cluster'):
+            column = np.ascontiguousarray(getattr(index, name))
+            # Хеширование блоками, чтобы не копировать отображенный в память столбец
+            for start in range(0, len(column), CELL_ASSIGN_CHUNK * 64):
+                digest.update(column[start:start + CELL_ASSIGN_CHUNK * 64])
+        return digest.hexdigest()
+
+    def to_frame(self):
+        """Таблица маршрутов с метками кластеров"""
+        import pandas as pd
+        index = self._compacted()
+        frame = pd.DataFrame(np.asarray(index.features), columns=FEATURES)
+        frame.insert(0, 'route_id', np.asarray(index.route_id))
+        frame['success_rate'] = np.asarray(index.success_rate)
+        frame['cluster'] = np.asarray(index.cluster)
+        return frame
+
+    def nearest(self, query, centers, mean, scale, k: int = 5, n_probe: int = 8,
+                success_weight: float = 0.0) -> List[Dict]:
+        """Ближайшие маршруты в масштабированном пространстве признаков.
+
+        IVF-поиск: просматриваются только n_probe ближайших к запросу ячеек
+        (около sqrt(n) маршрутов каждая). Для индекса без ячеек грубыми
+        ячейками служат сами кластеры с центрами centers. Оценка маршрута
+        равна 1 / (1 + расстояние), умноженной на success_rate ** success_weight.
+        """
+        if k < 1:
+            raise ValueError("Число маршрутов k должно быть положительным")
+        n_probe = max(1, n_probe)
+
+        # Расстояние считается в исходных единицах с делением на масштаб,
+        # чтобы не масштабировать весь кластер и не выходить из float32
+        dtype = self.features.dtype if self.features.dtype.kind == 'f' else np.float64
+        query_raw = (np.asarray(query) * scale + mean).astype(dtype)
+        inv_scale = (1 / np.asarray(scale)).astype(dtype)
+
+        if self.has_cells:
+            cell_distance = (((self.cell_centers - query_raw) * inv_scale) ** 2).sum(axis=1)
+            probe = np.argsort(cell_distance, kind='stable')[:n_probe]
+        else:
+            centers = np.asarray(centers)
+            probe = np.argsort(((centers - query) ** 2).sum(axis=1))[:n_probe]
+        if not len(probe):
+            return []
+
+        parts = []
+        for index in [self] + self._runs:
+            if self.has_cells:
+                spans = [index.cell_order[index.cell_offsets[j]:index.cell_offsets[j + 1]] for j in probe]
+            else:
+                spans = [np.arange(s.start, s.stop) for s in map(index.cluster_slice, probe.tolist())]
+            # Позиции сортируются, чтобы чтение отображенных файлов шло по возрастанию адресов
+            positions = np.sort(np.concatenate(spans))
+            if not len(positions):
+                continue
+            features = index.features[positions]
+            distance = np.sqrt((((features - query_raw) * inv_scale) ** 2).sum(axis=1))
+            parts.append((index.route_id[positions], features, index.success_rate[positions], distance,
+                          index.cluster[positions]))
+        if not parts:
+            return []
+
+        route_ids, features, success, distance, clusters = (np.concatenate(column) for column in zip(*parts))
+        score = 1 / (1 + distance.astype(np.float64))
+        if success_weight:
+            score = score * success.astype(np.float64) ** success_weight
+
+        # argpartition отбирает k лучших за линейное время, сортируются только они
+        if len(score) > k:
+            best = np.argpartition(-score, k - 1)[:k]
+        else:
+            best = np.arange(len(score))
+        best = best[np.argsort(-score[best], kind='stable')]
+
+        route_ids = route_ids[best].tolist()
+        scores = score[best].tolist()
+        distances = distance[best].astype(np.float64).tolist()
+        success = _to_list(success[best])
+        times = _to_list(features[best, 2])
+        costs = _to_list(features[best, 3])
+        clusters = clusters[best].astype(np.int64).tolist()
+
+        return [{
+            'route_id': route_ids[i],
+            'similarity_score': scores[i],
+            'distance': distances[i],
+            'success_rate': success[i],
+            'estimated_time': times[i],
+            'estimated_cost': costs[i],
+            'cluster': clusters[i]
+        } for i in range(len(route_ids))]
+
+    def top_k(self, cluster: int, k: int = 5) -> List[Dict]:
+        """Лучшие по успешности маршруты кластера"""
+        s = self.cluster_slice(cluster)
+        stop = min(s.start + k, s.stop)
+        route_ids = self.route_id[s.start:stop]
+        success = self.success_rate[s.start:stop]
+        features = self.features[s.start:stop]
+
+        if self._runs:
+            # Каждый пакет отсортирован, поэтому достаточно первых k маршрутов из каждого
+            parts = [(route_ids, success, features)]
+            for run in self._runs:
+                r = run.cluster_slice(cluster)
+                r = slice(r.start, min(r.start + k, r.stop))
+                parts.append((run.route_id[r], run.success_rate[r], run.features[r]))
+            route_ids, success, features = (np.concatenate(column) for column in zip(*parts))
+            order = np.argsort(-success, kind='stable')[:k]
+            route_ids, success, features = route_ids[order], success[order], features[order]
+
+        route_ids = route_ids.tolist()
+        success = _to_list(success)
+        times = _to_list(features[:, 2])
+        costs = _to_list(features[:, 3])
+
+        return [{
+            'route_id': route_ids[i],
+            'similarity_score': success[i],
+            'estimated_time': times[i],
+            'estimated_cost': costs[i],
+            'cluster': int(cluster)
+        } for i in range(len(route_ids))]
@@ -0,0 +1,152 @@
+import json
+import os
+import numpy as np
+from typing import Dict, List
+
+from route_index import FEATURES
+
+DEFAULT_RULES_PATH = os.environ.get(
+    "CARGO_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "recommendation_rules.json")
+)
+
+# Операторы условий в таблице правил
+OPERATORS = {
+    'lt': np.less,
+    'le': np.less_equal,
+    'gt': np.greater,
+    'ge': np.greater_equal,
+    'eq': np.equal
+}
+
+def file_stamp(path: str):
+    """Время изменения и размер файла правил; по ним замечается его замена"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def cargo_matrix(cargo_list: List[Dict]) -> np.ndarray:
+    """Признаки пакета грузов в виде матрицы (строка на груз, столбцы в порядке FEATURES)"""
+    return np.array([[cargo[f] for f in FEATURES] for cargo in cargo_list], dtype=float).reshape(-1, len(FEATURES))
+
+def matrix_columns(matrix: np.ndarray) -> Dict[str, np.ndarray]:
+    """Столбцы матрицы признаков по именам (без копирования)"""
+    return {f: matrix[:, i] for i, f in enumerate(FEATURES)}
+
+def cargo_columns(cargo_list: List[Dict]) -> Dict[str, np.ndarray]:
+    """Признаки пакета грузов в виде столбцов"""
+    return matrix_columns(cargo_matrix(cargo_list))
+
+class RuleEngine:
+    """Таблица правил для рекомендаций по транспорту, стоимости и погоде.
+
+    Правила загружаются из JSON и компилируются в векторные предикаты над
+    столбцами пакета грузов. Тексты ответов создаются один раз при загрузке
+    и разделяются между всеми ответами, поэтому результаты нельзя изменять.
+    """
+
+    def __init__(self, config: Dict):
+        for section in ('vehicles', 'cost_suggestions', 'weather'):
+            for rule in config.get(section, []):
+                self._validate(rule.get('when', {}))
+        self.config = config
+        self.vehicles = config.get('vehicles', [])
+        self.cost_rules = config.get('cost_suggestions', [])
+        self.weather_rules = config.get('weather', [])
+
+        # Готовые фрагменты ответов
+        self._vehicle_responses = [[rule['recommendation']] for rule in self.vehicles]
+        self._cost_percents = np.array(
+            [rule['suggestion']['potential_savings_percent'] for rule in self.cost_rules], dtype=float
+        )
+        self._cost_patterns = {}
+        self._weather_patterns = {}
+        # Файл, из которого загружены правила, и его отметка на момент загрузки
+        self.path = None
+        self.stamp = None
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_RULES_PATH) -> 'RuleEngine':
+        """Загрузка таблицы правил из файла"""
+        stamp = file_stamp(path)
+        with open(path, encoding='utf-8') as f:
+            engine = cls(json.load(f))
+        engine.path, engine.stamp = path, stamp
+        return engine
+
+    def file_changed(self) -> bool:
+        """Изменился ли файл правил после загрузки"""
+        return self.path is not None and file_stamp(self.path) != self.stamp
+
+    @staticmethod
+    def _validate(when: Dict):
+        for feature, conditions in when.items():
+            if feature not in FEATURES:
+                raise ValueError(f"Неизвестный признак в правиле: {feature}")
+            for op in conditions:
+                if op not in OPERATORS:
+                    raise ValueError(f"Неизвестный оператор в правиле: {op}")
+
+    @staticmethod
+    def _mask(when: Dict, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Векторный предикат: все условия правила выполняются одновременно"""
+        n = len(columns[FEATURES[0]])
+        mask = np.ones(n, dtype=bool)
+        for feature, conditions in when.items():
+            for op, value in conditions.items():
+                mask &= OPERATORS[op](columns[feature], value)
+        return mask
+
+    def _patterns(self, rules: List[Dict], columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Битовая маска сработавших правил для каждого груза"""
+        n = len(columns[FEATURES[0]])
+        codes = np.zeros(n, dtype=np.int64)
+        for i, rule in enumerate(rules):
+            codes |= self._mask(rule.get('when', {}), columns).astype(np.int64) << i
+        return codes
+
+    def vehicle_conditions(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Выполнение условий правил транспорта (строка - правило, столбец - груз)"""
+        n = len(columns[FEATURES[0]])
+        return np.array([self._mask(rule.get('when', {}), columns) for rule in self.vehicles], dtype=bool).reshape(len(self.vehicles), n)
+
+    def vehicle_choice(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Номер первого подходящего правила транспорта (-1, если ни одно не подошло)"""
+        conditions = self.vehicle_conditions(columns)
+        if not len(conditions):
+            return np.full(conditions.shape[1], -1)
+        return np.select(list(conditions), np.arange(len(conditions)), default=-1)
+
+    def vehicle_recommendations(self, columns: Dict[str, np.ndarray]) -> List[List[Dict]]:
+        """Рекомендации по транспорту для пакета грузов"""
+        return [self._vehicle_responses[i] if i >= 0 else [] for i in self.vehicle_choice(columns).tolist()]
+
+    def cost_optimization(self, columns: Dict[str, np.ndarray]) -> List[Dict]:
+        """Рекомендации по оптимизации стоимости для пакета грузов"""
+        codes = self._patterns(self.cost_rules, columns)
+        percents = np.zeros(len(codes))
+        for code in np.unique(codes).tolist():
+            if code not in self._cost_patterns:
+                self._cost_patterns[code] = (
+                    [rule['suggestion'] for i, rule in enumerate(self.cost_rules) if code >> i & 1],
+                    float(sum(self._cost_percents[i] for i in range(len(self.cost_rules)) if code >> i & 1))
+                )
+            percents[codes == code] = self._cost_patterns[code][1]
+
+        costs = columns['cost']
+        savings = (costs * (percents / 100)).tolist()
+        return [{
+            'current_cost': cost,
+            'optimization_suggestions': self._cost_patterns[code][0],
+            'potential_savings': saving
+        } for cost, code, saving in zip(costs.tolist(), codes.tolist(), savings)]
+
+    def weather_recommendations(self, columns: Dict[str, np.ndarray]) -> List[Dict]:
+        """Рекомендации с учетом погоды для пакета грузов"""
+        codes = self._patterns(self.weather_rules, columns)
+        for code in np.unique(codes).tolist():
+            if code not in self._weather_patterns:
+                matched = [rule for i, rule in enumerate(self.weather_rules) if code >> i & 1]
+                self._weather_patterns[code] = {
+                    'weather_considerations': [text for rule in matched for text in rule.get('weather_considerations', [])],
+                    'safety_recommendations': [text for rule in matched for text in rule.get('safety_recommendations', [])]
+                }
+        return [self._weather_patterns[code] for code in codes.tolist()]
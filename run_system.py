@@ -1,101 +1,110 @@
-import subprocess
-import time
-import webbrowser
-import requests
-import sys
-import os
-
-def check_dependencies():
-    """Проверка и установка зависимостей"""
-    print("Проверка зависимостей...")
-    try:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"])
-        print("Зависимости установлены успешно")
-    except Exception as e:
-        print(f"Ошибка при установке зависимостей: {str(e)}")
-        return False
-    return True
-
-def start_server():
-    """Запуск сервера"""
-    print("Запуск сервера...")
-    try:
-        # Запускаем сервер в отдельном процессе
-        server_process = subprocess.Popen(
-            [sys.executable, "api.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        
-        # Даем серверу время на запуск
-        time.sleep(3)
-        
-        # Проверяем, запустился ли сервер
-        try:
-            response = requests.get("http://127.0.0.1:8000/")
-            if response.status_code == 200:
-                print("Сервер успешно запущен")
-                return server_process
-        except:
-            try:
-                response = requests.get("http://127.0.0.1:8080/")
-                if response.status_code == 200:
-                    print("Сервер успешно запущен на порту 8080")
-                    return server_process
-            except:
-                print("Не удалось запустить сервер")
-                server_process.terminate()
-                return None
-                
-    except Exception as e:
-        print(f"Ошибка при запуске сервера: {str(e)}")
-        return None
-
-def open_browser():
-    """Открытие браузера с документацией API"""
-    print("Открытие документации API...")
-    try:
-        webbrowser.open("http://127.0.0.1:8000/docs")
-    except:
-        try:
-            webbrowser.open("http://127.0.0.1:8080/docs")
-        except:
-            print("Не удалось открыть документацию в браузере")
-
-def main():
-    """Основная функция запуска системы"""
-    print("Запуск системы рекомендаций для грузоперевозок...")
-    
-    # Проверяем наличие всех необходимых файлов
-    required_files = ["api.py", "recommendation_system.py", "visualization.py", "cargo_data.csv"]
-    for file in required_files:
-        if not os.path.exists(file):
-            print(f"Ошибка: файл {file} не найден")
-            return
-    
-    # Устанавливаем зависимости
-    if not check_dependencies():
-        return
-    
-    # Запускаем сервер
-    server_process = start_server()
-    if not server_process:
-        return
-    
-    # Открываем документацию в браузере
-    open_browser()
-    
-    print("\nСистема запущена и готова к использованию!")
-    print("Документация API открыта в вашем браузере")
-    print("Для остановки сервера нажмите Ctrl+C")
-    
-    try:
-        # Держим процесс запущенным
-        server_process.wait()
-    except KeyboardInterrupt:
-        print("\nОстановка сервера...")
-        server_process.terminate()
-        print("Сервер остановлен")
-
-if __name__ == "__main__":
-    main() 
\ No newline at end of file
+import argparse
+import subprocess
+import time
+import webbrowser
+import requests
+import sys
+import os
+
+def check_dependencies():
+    """Проверка и установка зависимостей"""
+    print("Проверка зависимостей...")
+    try:
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"])
+        print("Зависимости установлены успешно")
+    except Exception as e:
+        print(f"Ошибка при установке зависимостей: {str(e)}")
+        return False
+    return True
+
+def wait_until_ready(server_process, base_url: str, timeout: float = 60.0) -> bool:
+    """Ожидание готовности сервера по /health вместо фиксированной паузы"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server_process.poll() is not None:
+            # Процесс завершился, не дождавшись готовности (например, порт занят)
+            return False
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+def start_server(host: str, port: int, workers: int):
+    """Запуск сервера"""
+    print(f"Запуск сервера ({workers} рабочих процессов)...")
+    try:
+        # Вывод сервера не перехватывается: неразобранный канал заполнился бы и остановил сервер
+        server_process = subprocess.Popen([
+            sys.executable, "serve.py", "--host", host, "--port", str(port), "--workers", str(workers)
+        ])
+
+        if wait_until_ready(server_process, f"http://{host}:{port}"):
+            print(f"Сервер успешно запущен на порту {port}")
+            return server_process
+        print("Не удалось запустить сервер")
+        server_process.terminate()
+        return None
+
+    except Exception as e:
+        print(f"Ошибка при запуске сервера: {str(e)}")
+        return None
+
+def open_browser(host: str, port: int):
+    """Открытие браузера с документацией API"""
+    print("Открытие документации API...")
+    try:
+        webbrowser.open(f"http://{host}:{port}/docs")
+    except:
+        print("Не удалось открыть документацию в браузере")
+
+def main():
+    """Основная функция запуска системы"""
+    parser = argparse.ArgumentParser(description="Запуск системы рекомендаций для грузоперевозок")
+    parser.add_argument('--install-deps', action='store_true', help="Установить зависимости из requirements.txt перед запуском")
+    parser.add_argument('--host', default="127.0.0.1", help="Адрес сервера")
+    parser.add_argument('--port', type=int, default=8000, help="Порт сервера")
+    parser.add_argument('--workers', type=int, default=int(os.environ.get("CARGO_WORKERS", os.cpu_count() or 1)),
+                        help="Число рабочих процессов API")
+    parser.add_argument('--no-browser', action='store_true', help="Не открывать документацию в браузере")
+    args = parser.parse_args()
+
+    print("Запуск системы рекомендаций для грузоперевозок...")
+
+    # Проверяем наличие всех необходимых файлов
+    required_files = ["api.py", "serve.py", "recommendation_system.py", "visualization.py", "cargo_data.csv"]
+    for file in required_files:
+        if not os.path.exists(file):
+            print(f"Ошибка: файл {file} не найден")
+            return
+
+    # Зависимости устанавливаются только по запросу, а не при каждом запуске
+    if args.install_deps and not check_dependencies():
+        return
+
+    # Запускаем сервер
+    server_process = start_server(args.host, args.port, args.workers)
+    if not server_process:
+        return
+
+    if not args.no_browser:
+        # Открываем документацию в браузере
+        open_browser(args.host, args.port)
+
+    print("\nСистема запущена и готова к использованию!")
+    print(f"Документация API: http://{args.host}:{args.port}/docs")
+    print("Для остановки сервера нажмите Ctrl+C")
+
+    try:
+        # Держим процесс запущенным
+        server_process.wait()
+    except KeyboardInterrupt:
+        print("\nОстановка сервера...")
+        server_process.terminate()
+        server_process.wait()
+        print("Сервер остановлен")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import argparse
+import os
+import tempfile
+
+import uvicorn
+
+def main():
+    parser = argparse.ArgumentParser(description="Запуск API в рабочем режиме: несколько процессов, без перезагрузки по изменению кода")
+    parser.add_argument('--host', default=os.environ.get("CARGO_HOST", "127.0.0.1"), help="Адрес для прослушивания")
+    parser.add_argument('--port', type=int, default=int(os.environ.get("CARGO_PORT", 8000)), help="Порт")
+    parser.add_argument('--workers', type=int, default=int(os.environ.get("CARGO_WORKERS", os.cpu_count() or 1)),
+                        help="Число рабочих процессов")
+    parser.add_argument('--log-level', default="info", help="Уровень журналирования uvicorn")
+    parser.add_argument('--inference-only', action='store_true',
+                        help="Загружать модели без scikit-learn: быстрее запуск и меньше памяти, но без /ingest")
+    args = parser.parse_args()
+
+    if args.inference_only:
+        # Рабочие процессы наследуют окружение и читают флаг при импорте api
+        os.environ["CARGO_INFERENCE_ONLY"] = "1"
+    if args.workers > 1 and not os.environ.get("CARGO_METRICS_DIR"):
+        # У каждого процесса свои метрики; /metrics объединяет снимки всех процессов из этого каталога
+        os.environ["CARGO_METRICS_DIR"] = tempfile.mkdtemp(prefix="cargo-metrics-")
+
+    # Каждый рабочий процесс загружает модель при старте и сам подхватывает новые версии
+    # (см. CARGO_MODEL_POLL_INTERVAL), поэтому переобучение не требует перезапуска
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import pytest
+
+from recommendation_system import CargoRecommendationSystem
+
+def test_plan_prices_trip_by_vehicle():
+    system = CargoRecommendationSystem()
+    light = system.plan_loads([dict(weight=400, distance=50, delivery_time=5, cost=1000)] * 2)
+    assert light['summary']['trips'] == 1 and light['summary']['savings_percent'] == 50.0
+    # Вместе грузы не помещаются в малый грузовик: рейс дороже пропорционально расходу топлива
+    heavy = system.plan_loads([dict(weight=800, distance=50, delivery_time=5, cost=1000),
+                               dict(weight=800, distance=25, delivery_time=5, cost=600)])
+    trip, = heavy['trips']
+    assert trip['vehicle_type'] == 'medium_truck'
+    assert trip['cost'] == pytest.approx(max(1000, 600 * 2) * 16.5 / 11)
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from road_network import RoadNetwork
+
+@pytest.mark.parametrize("undirected", [False, True])
+def test_search_matches_dijkstra(undirected):
+    rng = np.random.default_rng(0)
+    source, target = rng.integers(0, 300, 900), rng.integers(0, 300, 900)
+    distance = rng.choice([0.0, 1.0, 2.5, 7.0], 900)
+    network = RoadNetwork.from_edges(source, target, distance, undirected=undirected, n_hubs=4, cell_size=20)
+    graph = csr_matrix((network.distance, network.indices, network.indptr), shape=(network.n_nodes,) * 2)
+    expected = dijkstra(graph)
+    for s, t in rng.integers(0, network.n_nodes, (300, 2)).tolist():
+        np.testing.assert_allclose(network._search(s, t)[0], expected[s, t])
+
+def test_route_sums_time_along_path(tmp_path):
+    # Короткий путь 0-1-2 длиннее по времени, чем прямое ребро 0-2
+    network = RoadNetwork.from_edges([0, 1, 0], [1, 2, 2], [1.0, 1.0, 5.0], [3.0, 4.0, 1.0], n_hubs=1, cell_size=1)
+    assert network.route(0, 2) == {'distance': 2.0, 'delivery_time': 7.0}
+    with pytest.raises(ValueError):
+        network.route(2, 0)
+
+    network.save(str(tmp_path))
+    stored = RoadNetwork.open(str(tmp_path))
+    assert stored.route(0, 2) == {'distance': 2.0, 'delivery_time': 7.0}
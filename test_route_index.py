@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from route_index import RouteIndex, FEATURES
+from recommendation_system import CargoRecommendationSystem
+
+def make_routes(n, n_clusters=5, seed=0):
+    rng = np.random.default_rng(seed)
+    return (
+        np.arange(n, dtype=np.int32) + seed * 100_000,
+        rng.uniform(1, 1000, (n, len(FEATURES))),
+        rng.uniform(0.5, 1.0, n),
+        rng.integers(0, n_clusters, n)
+    )
+
+def index_rows(index):
+    """Маршруты индекса по кластерам (порядок внутри кластера - по успешности)"""
+    index.compact()
+    return [sorted(zip(index.success_rate[index.cluster_slice(c)].tolist(),
+                       index.route_id[index.cluster_slice(c)].tolist()), reverse=True)
+            for c in range(index.n_clusters)]
+
+def test_insert_matches_rebuild():
+    base = make_routes(500)
+    batches = [make_routes(n, seed=i + 1) for i, n in enumerate([3, 40, 7, 120, 1])]
+    index = RouteIndex.from_arrays(*base, n_clusters=5)
+    for batch in batches:
+        index.insert(*batch)
+
+    parts = [base] + batches
+    full = RouteIndex.from_arrays(*(np.concatenate(column) for column in zip(*parts)), n_clusters=5)
+    assert len(index) == len(full)
+    for c in range(5):
+        assert index.top_k(c, k=10) == full.top_k(c, k=10)
+    assert index_rows(index) == index_rows(full)
+
+def test_compact_merges_runs():
+    index = RouteIndex.from_arrays(*make_routes(1000), n_clusters=5)
+    index.insert(*make_routes(10, seed=1))
+    assert index._runs
+    index.compact()
+    assert not index._runs and len(index.route_id) == 1010
+    assert np.all(np.diff(index.cluster) >= 0)
+    for c in range(5):
+        assert np.all(np.diff(index.success_rate[index.cluster_slice(c)]) <= 0)
+
+def test_insert_rejects_unknown_cluster():
+    index = RouteIndex.from_arrays(*make_routes(100), n_clusters=5)
+    route_id, features, success, _ = make_routes(2, seed=1)
+    with pytest.raises(ValueError):
+        index.insert(route_id, features, success, np.array([0, 5]))
+
+def test_empty_last_cluster_is_kept():
+    route_id, features, success, cluster = make_routes(100, n_clusters=4)
+    index = RouteIndex.from_arrays(route_id, features, success, cluster, n_clusters=5)
+    assert index.n_clusters == 5 and index.top_k(4) == []
+    short = RouteIndex.from_arrays(route_id, features, success, cluster)
+    short.ensure_n_clusters(5)
+    assert short.n_clusters == 5
+    short.insert(*make_routes(1, seed=1)[:3], np.array([4]))
+    assert short.top_k(4)[0]['route_id'] == 100_000
+
+@pytest.fixture
+def trained_system(tmp_path):
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.uniform(1, 1000, (300, len(FEATURES))), columns=FEATURES)
+    data.insert(0, 'route_id', np.arange(300))
+    data['success_rate'] = rng.uniform(0.5, 1.0, 300)
+    path = tmp_path / "routes.csv"
+    data.to_csv(path, index=False)
+    system = CargoRecommendationSystem()
+    system.load_data(str(path))
+    system.train_model(n_clusters=5)
+    return system
+
+def test_ingest_moves_centers_to_running_mean(trained_system):
+    system = trained_system
+    counts = system.cluster_counts.copy()
+    centers = system.scaler.inverse_transform(system.model.cluster_centers_)
+
+    rng = np.random.default_rng(1)
+    routes = [dict(zip(FEATURES, x), route_id=1000 + i, success_rate=0.9)
+              for i, x in enumerate(rng.uniform(1, 1000, (20, len(FEATURES))).tolist())]
+    X = np.array([[route[f] for f in FEATURES] for route in routes])
+
+    result = system.ingest_routes(routes)
+    assert result == {'ingested': 20, 'n_samples': 320}
+
+    # Маршруты относятся к ближайшему из прежних центров в новой шкале признаков
+    clusters = ((X[:, None, :] - centers[None]) ** 2 / system.scaler.scale_ ** 2).sum(axis=2).argmin(axis=1)
+
+    new_centers = system.scaler.inverse_transform(system.model.cluster_centers_)
+    assigned = system.route_index.to_frame().set_index('route_id').loc[[r['route_id'] for r in routes], 'cluster']
+    np.testing.assert_array_equal(assigned.to_numpy(), clusters)
+    for c in range(5):
+        added = X[clusters == c]
+        expected = (centers[c] * counts[c] + added.sum(axis=0)) / (counts[c] + len(added))
+        np.testing.assert_allclose(new_centers[c], expected, rtol=1e-9)
+    np.testing.assert_array_equal(system.cluster_counts, counts + np.bincount(clusters, minlength=5))
+
+def test_ingest_endpoint_maps_client_errors_to_400(trained_system, tmp_path):
+    from fastapi.testclient import TestClient
+    import api
+
+    route = dict(weight=1, distance=2, delivery_time=3, cost=4, route_id=1, success_rate=0.9)
+    client = TestClient(api.app)
+    previous = api.recommendation_system
+    try:
+        api.install_system(CargoRecommendationSystem())
+        response = client.post("/ingest", json=[route])
+        assert response.status_code == 400 and response.json()['detail'].startswith("Model not trained")
+
+        trained_system.save_model(str(tmp_path / "model"))
+        inference = CargoRecommendationSystem()
+        inference.load_model(str(tmp_path / "model"), inference_only=True)
+        api.install_system(inference)
+        assert client.post("/ingest", json=[route]).status_code == 400
+    finally:
+        api.install_system(previous)
+
+def test_ingest_endpoint_keeps_training_csv(trained_system, tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    import api
+
+    ingested = tmp_path / "ingested" / "routes.csv"
+    monkeypatch.setattr(api, "INGESTED_DATA_PATH", str(ingested))
+    routes = [dict(weight=1, distance=2, delivery_time=3, cost=4, route_id=1000 + i, success_rate=0.9) for i in range(2)]
+    client = TestClient(api.app)
+    previous = api.recommendation_system
+    try:
+        api.install_system(trained_system)
+        for route in routes:
+            assert client.post("/ingest", json=[route]).status_code == 200
+    finally:
+        api.install_system(previous)
+    assert pd.read_csv(ingested)['route_id'].tolist() == [1000, 1001]
+    assert api.training_data() == [api.DATA_PATH, str(ingested)]
+
+    system = CargoRecommendationSystem()
+    system.load_data([str(tmp_path / "routes.csv"), str(ingested)])
+    assert len(system.data) == 302
+
+def test_inference_only_replays_ingest_log(trained_system, tmp_path):
+    path = str(tmp_path / "model")
+    trained_system.save_model(path)
+    inference = CargoRecommendationSystem()
+    inference.load_model(path, inference_only=True)
+
+    rng = np.random.default_rng(2)
+    routes = [dict(zip(FEATURES, x), route_id=2000 + i, success_rate=1.0)
+              for i, x in enumerate(rng.uniform(1, 1000, (30, len(FEATURES))).tolist())]
+    trained_system.ingest_routes_shared(routes, path)
+
+    assert inference.replay_ingest_log(path) == 1
+    assert inference.n_samples == 330
+    expected = trained_system.route_index.to_frame().sort_values('route_id').reset_index(drop=True)
+    replayed = inference.route_index.to_frame().sort_values('route_id').reset_index(drop=True)
+    pd.testing.assert_frame_equal(replayed, expected, check_dtype=False)
+
+    # При загрузке версии журнал применяется целиком
+    restarted = CargoRecommendationSystem()
+    restarted.load_model(path, inference_only=True)
+    assert restarted.n_samples == 330
+
+def test_nearest_probes_cells_within_clusters(tmp_path):
+    route_id, features, success, cluster = make_routes(2000)
+    index = RouteIndex.from_arrays(route_id, features, success, cluster, n_clusters=5)
+    scale, mean = features.std(axis=0), features.mean(axis=0)
+    index.build_cells(scale)
+    assert len(index.cell_centers) == sum(int(np.ceil(np.sqrt(n))) for n in np.diff(index.offsets))
+    assert index.cell_offsets[-1] == len(index)
+    # Ячейка не выходит за пределы своего кластера
+    for c in range(5):
+        cells = slice(index.cell_bounds[c], index.cell_bounds[c + 1] + 1)
+        positions = index.cell_order[index.cell_offsets[cells][0]:index.cell_offsets[cells][-1]]
+        assert np.all(index.cluster[positions] == c)
+
+    # При n_probe=1 просматривается только ближайшая к запросу ячейка
+    query = features[0]
+    probed = index.nearest((query - mean) / scale, None, mean, scale, k=1000, n_probe=1)
+    nearest_cell = (((index.cell_centers - query) / scale) ** 2).sum(axis=1).argmin()
+    members = index.cell_order[index.cell_offsets[nearest_cell]:index.cell_offsets[nearest_cell + 1]]
+    assert sorted(r['route_id'] for r in probed) == sorted(index.route_id[members].tolist())
+
+    # При просмотре всех ячеек результат совпадает с полным перебором
+    everything = index.nearest((query - mean) / scale, None, mean, scale, k=10, n_probe=len(index.cell_centers))
+    distance = np.sqrt((((features - query) / scale) ** 2).sum(axis=1))
+    assert [r['route_id'] for r in everything] == route_id[np.argsort(distance)[:10]].tolist()
+
+    index.insert(*make_routes(30, seed=1))
+    index.save(str(tmp_path))
+    stored = RouteIndex.open(str(tmp_path))
+    assert stored.has_cells and stored.cell_offsets[-1] == len(stored) == 2030
+
+def test_similar_routes_reject_nonpositive_k(trained_system):
+    from fastapi.testclient import TestClient
+    import api
+
+    cargo = dict(weight=10, distance=500, delivery_time=30, cost=100)
+    with pytest.raises(ValueError):
+        trained_system.find_similar_routes(cargo, k=0)
+
+    client = TestClient(api.app)
+    previous = api.recommendation_system
+    try:
+        api.install_system(trained_system)
+        assert client.post("/recommend/route/similar?k=0", json=cargo).status_code == 422
+        assert client.post("/recommend/route/similar?n_probe=0", json=cargo).status_code == 422
+        response = client.post("/recommend/route/similar?k=3", json=cargo)
+        assert response.status_code == 200 and len(response.json()['recommendations']) == 3
+    finally:
+        api.install_system(previous)
+
+def test_insert_into_cluster_without_cells():
+    route_id, features, success, cluster = make_routes(100, n_clusters=4)
+    index = RouteIndex.from_arrays(route_id, features, success, cluster, n_clusters=5)
+    index.build_cells(features.std(axis=0))
+    assert index.cell_bounds[5] == index.cell_bounds[4]
+    index.insert(*make_routes(1, seed=1)[:3], np.array([4]))
+    index.insert(*make_routes(5, seed=2))
+    index.compact()
+    assert index.cell_bounds[5] == index.cell_bounds[4] + 1
+    assert np.all(np.diff(index.cell_offsets) >= 0) and index.cell_offsets[-1] == len(index)
+    positions = index.cell_order[index.cell_offsets[index.cell_bounds[4]]:index.cell_offsets[index.cell_bounds[5]]]
+    assert 100_000 in index.route_id[positions].tolist()
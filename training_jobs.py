@@ -0,0 +1,178 @@
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Union
+
+import metrics
+
+def job_path(jobs_dir: str, job_id: str) -> str:
+    return os.path.join(jobs_dir, f"{job_id}.json")
+
+def read_job(jobs_dir: str, job_id: str) -> Optional[Dict]:
+    """Состояние задачи из ее файла или None, если задачи нет"""
+    # Идентификатор задачи не должен выводить за пределы каталога задач
+    if not job_id or job_id != os.path.basename(job_id) or job_id.startswith('.'):
+        return None
+    try:
+        with open(job_path(jobs_dir, job_id), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def update_job(jobs_dir: str, job_id: str, **fields):
+    """Обновление полей задачи с атомарной заменой файла"""
+    job = read_job(jobs_dir, job_id) or {'job_id': job_id}
+    job.update(fields)
+    tmp_path = f"{job_path(jobs_dir, job_id)}.tmp-{uuid.uuid4().hex[:6]}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(tmp_path, job_path(jobs_dir, job_id))
+
+def run_training_job(job_id: str, data_path: Union[str, List[str]], model_path: str, n_clusters: Union[int, str], streaming: bool,
+                     jobs_dir: str, alias: Optional[str] = None):
+    """Обучение модели в рабочем процессе пула.
+
+    Этап и доля выполнения записываются в файл задачи. Если задан alias,
+    версия не публикуется как последняя, а получает это имя.
+    """
+    import model_artifact
+    from recommendation_system import CargoRecommendationSystem
+
+    def report(stage: str, fraction: float):
+        update_job(jobs_dir, job_id, stage=stage, progress=fraction)
+
+    system = CargoRecommendationSystem()
+
+    if streaming:
+        # Потоковое обучение совмещает чтение данных и обучение
+        report('train', 0.0)
+        system.train_model_streaming(data_path, n_clusters=n_clusters)
+    else:
+        report('load', 0.0)
+        system.load_data(data_path)
+
+        report('train', 0.2)
+        system.train_model(n_clusters=n_clusters)
+
+    report('save', 0.9)
+    version = system.save_model(model_path, publish=alias is None)
+    if alias is not None:
+        model_artifact.set_alias(model_path, alias, version)
+
+    report('done', 1.0)
+    # Обученная система не передается обратно целиком: API загружает
+    # опубликованный артефакт с отображением индекса в память
+    return {'model_version': version, 'stage_timings': system.stage_timings}
+
+class TrainingJobManager:
+    """Фоновые задачи обучения в пуле процессов.
+
+    Обучение выполняется вне процесса API, поэтому цикл событий не блокируется.
+    Состояние каждой задачи хранится в файле {jobs_dir}/{job_id}.json, поэтому
+    его видят все рабочие процессы API, а не только принявший задачу.
+    В on_complete передается версия опубликованного артефакта; загрузить ее
+    и заменить рабочую модель - задача вызывающего. Модели, обученные под
+    именем (alias), в on_complete не передаются: они не заменяют рабочую.
+    """
+
+    def __init__(self, on_complete: Optional[Callable] = None, max_workers: int = 1,
+                 jobs_dir: str = os.path.join("cargo_model", "jobs")):
+        self.on_complete = on_complete
+        self.max_workers = max_workers
+        self.jobs_dir = jobs_dir
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _ensure_started(self):
+        # Пул создается при первой задаче
+        if self._executor is None:
+            context = multiprocessing.get_context('spawn')
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+
+    def submit(self, data_path: Union[str, List[str]], model_path: str = "cargo_model", n_clusters: Union[int, str] = 5,
+               streaming: bool = False, alias: Optional[str] = None) -> str:
+        """Постановка задачи обучения в очередь"""
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        update_job(
+            self.jobs_dir, job_id,
+            status='pending',
+            created_at=datetime.now().isoformat(),
+            finished_at=None,
+            error=None,
+            alias=alias,
+            model_version=None,
+            stage='pending',
+            progress=0.0
+        )
+        with self._lock:
+            self._ensure_started()
+            try:
+                future = self._executor.submit(
+                    run_training_job, job_id, data_path, model_path, n_clusters, streaming, self.jobs_dir, alias
+                )
+            except BrokenProcessPool:
+                # Рабочий процесс упал раньше, чем это заметил _finish: пул создается заново
+                self._executor = None
+                self._ensure_started()
+                future = self._executor.submit(
+                    run_training_job, job_id, data_path, model_path, n_clusters, streaming, self.jobs_dir, alias
+                )
+            executor = self._executor
+        future.add_done_callback(lambda f: self._finish(job_id, f, executor))
+        return job_id
+
+    def _finish(self, job_id: str, future, executor: ProcessPoolExecutor):
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            # Сломанный пул больше не принимает задачи; следующая задача создаст новый
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+        if error is None:
+            result = future.result()
+            # Замеры этапов сделаны в рабочем процессе, переносим их в метрики API
+            for stage, elapsed in result['stage_timings'].items():
+                metrics.TRAINING_STAGE_SECONDS.observe(elapsed, stage=stage)
+            update_job(self.jobs_dir, job_id, model_version=result['model_version'])
+            if self.on_complete is not None and read_job(self.jobs_dir, job_id)['alias'] is None:
+                try:
+                    self.on_complete(result['model_version'])
+                except Exception as e:
+                    error = e
+
+        update_job(
+            self.jobs_dir, job_id,
+            status='failed' if error is not None else 'completed',
+            error=str(error) if error is not None else None,
+            finished_at=datetime.now().isoformat()
+        )
+
+    def get_progress(self, job_id: str) -> Optional[Dict]:
+        """Текущий этап и доля выполнения задачи"""
+        job = read_job(self.jobs_dir, job_id)
+        if job is None:
+            return None
+        return {'stage': job.get('stage'), 'progress': job.get('progress')}
+
+    def get_status(self, job_id: str) -> Optional[Dict]:
+        """Состояние задачи вместе с прогрессом"""
+        status = read_job(self.jobs_dir, job_id)
+        if status is None:
+            return None
+        if status['status'] == 'pending' and status.get('stage') not in (None, 'pending'):
+            status['status'] = 'running'
+        return status
+
+    def shutdown(self):
+        """Остановка пула процессов"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
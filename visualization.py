@@ -1,97 +1,165 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pandas as pd
-import numpy as np
-
-class CargoVisualizer:
-    def __init__(self):
-        plt.style.use('seaborn-v0_8')
-        
-    def plot_route_clusters(self, data, clusters):
-        """Визуализация кластеров маршрутов"""
-        plt.figure(figsize=(12, 8))
-        scatter = plt.scatter(data['distance'], data['weight'], 
-                            c=clusters, cmap='viridis', 
-                            s=data['cost']/100, alpha=0.6)
-        plt.colorbar(scatter, label='Кластер')
-        plt.xlabel('Расстояние (км)')
-        plt.ylabel('Вес (кг)')
-        plt.title('Кластеризация маршрутов по расстоянию и весу')
-        plt.savefig('route_clusters.png')
-        plt.close()
-        
-    def plot_cost_analysis(self, data):
-        """Анализ стоимости перевозок"""
-        plt.figure(figsize=(12, 6))
-        sns.regplot(data=data, x='distance', y='cost')
-        plt.xlabel('Расстояние (км)')
-        plt.ylabel('Стоимость (руб)')
-        plt.title('Зависимость стоимости от расстояния')
-        plt.savefig('cost_analysis.png')
-        plt.close()
-        
-    def plot_delivery_time_analysis(self, data):
-        """Анализ времени доставки"""
-        plt.figure(figsize=(12, 6))
-        sns.boxplot(data=data, x='cluster', y='delivery_time')
-        plt.xlabel('Кластер')
-        plt.ylabel('Время доставки (часы)')
-        plt.title('Распределение времени доставки по кластерам')
-        plt.savefig('delivery_time_analysis.png')
-        plt.close()
-        
-    def plot_success_rate_analysis(self, data):
-        """Анализ успешности доставки"""
-        plt.figure(figsize=(12, 6))
-        sns.barplot(data=data, x='cluster', y='success_rate')
-        plt.xlabel('Кластер')
-        plt.ylabel('Успешность доставки')
-        plt.title('Успешность доставки по кластерам')
-        plt.savefig('success_rate_analysis.png')
-        plt.close()
-        
-    def generate_report(self, data, clusters):
-        """Генерация полного отчета с визуализациями"""
-        self.plot_route_clusters(data, clusters)
-        self.plot_cost_analysis(data)
-        self.plot_delivery_time_analysis(data)
-        self.plot_success_rate_analysis(data)
-        
-        # Создание HTML-отчета
-        html_report = f"""
-        <html>
-        <head>
-            <title>Анализ грузоперевозок</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                .container {{ max-width: 1200px; margin: 0 auto; }}
-                .image-container {{ margin: 20px 0; }}
-                img {{ max-width: 100%; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>Анализ грузоперевозок</h1>
-                <div class="image-container">
-                    <h2>Кластеризация маршрутов</h2>
-                    <img src="route_clusters.png" alt="Кластеризация маршрутов">
-                </div>
-                <div class="image-container">
-                    <h2>Анализ стоимости</h2>
-                    <img src="cost_analysis.png" alt="Анализ стоимости">
-                </div>
-                <div class="image-container">
-                    <h2>Анализ времени доставки</h2>
-                    <img src="delivery_time_analysis.png" alt="Анализ времени доставки">
-                </div>
-                <div class="image-container">
-                    <h2>Анализ успешности доставки</h2>
-                    <img src="success_rate_analysis.png" alt="Анализ успешности доставки">
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        with open('cargo_analysis_report.html', 'w', encoding='utf-8') as f:
-            f.write(html_report) 
\ No newline at end of file
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import seaborn as sns
+import pandas as pd
+import numpy as np
+import hashlib
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+REPORT_PATH = 'cargo_analysis_report.html'
+PLOT_FILES = {
+    'plot_route_clusters': 'route_clusters.png',
+    'plot_cost_analysis': 'cost_analysis.png',
+    'plot_delivery_time_analysis': 'delivery_time_analysis.png',
+    'plot_success_rate_analysis': 'success_rate_analysis.png'
+}
+
+# Графики строятся по случайной выборке не больше этого размера
+MAX_PLOT_POINTS = 20_000
+# Начиная с этого размера данных графики строятся параллельно в отдельных процессах
+PARALLEL_THRESHOLD = 100_000
+
+def report_key(data, clusters) -> str:
+    """Хеш данных и меток кластеров, по которому кешируется отчет"""
+    hashed = pd.util.hash_pandas_object(data.assign(cluster=np.asarray(clusters)), index=False)
+    return hashlib.sha256(hashed.to_numpy().tobytes()).hexdigest()
+
+def cached_report_key(path: str = REPORT_PATH):
+    """Ключ уже сгенерированного отчета или None, если отчета нет"""
+    if not os.path.exists(path) or not all(os.path.exists(f) for f in PLOT_FILES.values()):
+        return None
+    with open(path, encoding='utf-8') as f:
+        match = re.search(r'<meta name="report-key" content="([0-9a-f]+)">', f.read())
+    return match.group(1) if match else None
+
+def _render_plot(name: str, data, clusters, visualizer=None):
+    # В рабочем процессе пула визуализатор создается заново
+    if visualizer is None:
+        visualizer = CargoVisualizer()
+    if name == 'plot_route_clusters':
+        visualizer.plot_route_clusters(data, clusters)
+    else:
+        getattr(visualizer, name)(data)
+    return name
+
+class CargoVisualizer:
+    def __init__(self):
+        plt.style.use('seaborn-v0_8')
+        
+    def plot_route_clusters(self, data, clusters):
+        """Визуализация кластеров маршрутов"""
+        plt.figure(figsize=(12, 8))
+        scatter = plt.scatter(data['distance'], data['weight'], 
+                            c=clusters, cmap='viridis', 
+                            s=data['cost']/100, alpha=0.6)
+        plt.colorbar(scatter, label='Кластер')
+        plt.xlabel('Расстояние (км)')
+        plt.ylabel('Вес (кг)')
+        plt.title('Кластеризация маршрутов по расстоянию и весу')
+        plt.savefig('route_clusters.png')
+        plt.close()
+        
+    def plot_cost_analysis(self, data):
+        """Анализ стоимости перевозок"""
+        plt.figure(figsize=(12, 6))
+        sns.regplot(data=data, x='distance', y='cost')
+        plt.xlabel('Расстояние (км)')
+        plt.ylabel('Стоимость (руб)')
+        plt.title('Зависимость стоимости от расстояния')
+        plt.savefig('cost_analysis.png')
+        plt.close()
+        
+    def plot_delivery_time_analysis(self, data):
+        """Анализ времени доставки"""
+        plt.figure(figsize=(12, 6))
+        sns.boxplot(data=data, x='cluster', y='delivery_time')
+        plt.xlabel('Кластер')
+        plt.ylabel('Время доставки (часы)')
+        plt.title('Распределение времени доставки по кластерам')
+        plt.savefig('delivery_time_analysis.png')
+        plt.close()
+        
+    def plot_success_rate_analysis(self, data):
+        """Анализ успешности доставки"""
+        plt.figure(figsize=(12, 6))
+        sns.barplot(data=data, x='cluster', y='success_rate')
+        plt.xlabel('Кластер')
+        plt.ylabel('Успешность доставки')
+        plt.title('Успешность доставки по кластерам')
+        plt.savefig('success_rate_analysis.png')
+        plt.close()
+        
+    def generate_report(self, data, clusters, force: bool = False,
+                        max_points: int = MAX_PLOT_POINTS, parallel: bool = None, key: str = None) -> bool:
+        """Генерация полного отчета с визуализациями.
+
+        Отчет не перестраивается, если он уже построен для тех же данных и
+        кластеров. key - готовый ключ данных (по умолчанию хеш data и clusters).
+        Возвращает True, если отчет был сгенерирован заново.
+        """
+        key = key or report_key(data, clusters)
+        if not force and cached_report_key() == key:
+            return False
+            
+        if parallel is None:
+            parallel = len(data) >= PARALLEL_THRESHOLD and (os.cpu_count() or 1) > 1
+            
+        # Для больших наборов данных графики строятся по выборке
+        data = data.assign(cluster=np.asarray(clusters))
+        if len(data) > max_points:
+            data = data.sample(n=max_points, random_state=42)
+        clusters = data['cluster'].to_numpy()
+        
+        if parallel:
+            context = multiprocessing.get_context('spawn')
+            max_workers = min(len(PLOT_FILES), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+                list(executor.map(_render_plot, PLOT_FILES, [data] * len(PLOT_FILES), [clusters] * len(PLOT_FILES)))
+        else:
+            for name in PLOT_FILES:
+                _render_plot(name, data, clusters, visualizer=self)
+        
+        # Создание HTML-отчета
+        html_report = f"""
+        <html>
+        <head>
+            <title>Анализ грузоперевозок</title>
+            <meta name="report-key" content="{key}">
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 20px; }}
+                .container {{ max-width: 1200px; margin: 0 auto; }}
+                .image-container {{ margin: 20px 0; }}
+                img {{ max-width: 100%; }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <h1>Анализ грузоперевозок</h1>
+                <div class="image-container">
+                    <h2>Кластеризация маршрутов</h2>
+                    <img src="route_clusters.png" alt="Кластеризация маршрутов">
+                </div>
+                <div class="image-container">
+                    <h2>Анализ стоимости</h2>
+                    <img src="cost_analysis.png" alt="Анализ стоимости">
+                </div>
+                <div class="image-container">
+                    <h2>Анализ времени доставки</h2>
+                    <img src="delivery_time_analysis.png" alt="Анализ времени доставки">
+                </div>
+                <div class="image-container">
+                    <h2>Анализ успешности доставки</h2>
+                    <img src="success_rate_analysis.png" alt="Анализ успешности доставки">
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+        
+        with open(REPORT_PATH, 'w', encoding='utf-8') as f:
+            f.write(html_report)
+        return True 
\ No newline at end of file